@@ -6,10 +6,39 @@ class UserRequest:
     def __init__(self,
                  event: str,
                  stream_source: Union[str, None] = None,
-                 request_uuid: Union[str, None] = None):
+                 request_uuid: Union[str, None] = None,
+                 capture_backend: Union[str, None] = None,
+                 target_fps: Union[float, None] = None,
+                 model_imgsz: Union[int, None] = None,
+                 letterbox: Union[bool, None] = None,
+                 roi: Union[str, None] = None,
+                 gate_hash_distance: Union[int, None] = None,
+                 gate_black_level: Union[float, None] = None,
+                 gate_blur_var: Union[float, None] = None):
         self.event = event
         self.stream_source = stream_source
         self.request_uuid = request_uuid
+        self.capture_backend = capture_backend
+        self.target_fps = target_fps
+        self.model_imgsz = model_imgsz
+        self.letterbox = letterbox
+        self.roi = roi
+        self.gate_hash_distance = gate_hash_distance
+        self.gate_black_level = gate_black_level
+        self.gate_blur_var = gate_blur_var
+
+    def get_stream_params(self) -> dict:
+        params = {
+            "capture_backend": self.capture_backend,
+            "target_fps": self.target_fps,
+            "model_imgsz": self.model_imgsz,
+            "letterbox": self.letterbox,
+            "roi": self.roi,
+            "gate_hash_distance": self.gate_hash_distance,
+            "gate_black_level": self.gate_black_level,
+            "gate_blur_var": self.gate_blur_var,
+        }
+        return {key: val for key, val in params.items() if val is not None}
 
 
 class ShallowUserRequest:
@@ -26,3 +55,4 @@ class RequestState(BaseModel):
     active: str = "0"
     inactive: str = "0"
     detected_objects: list[str] = [""]
+    object_counts: dict[str, int] = {}
@@ -49,6 +49,16 @@ class FarseerAPI:
             for "start" - stream_source is required
 
             for "stop" - request_uuid is required
+
+            optional stream params for "start":
+            capture_backend - "opencv" (default) or "pyav" (key frames only decoding),
+            target_fps - how many frames per second are sampled for inference,
+            model_imgsz - frames are downscaled to the model input size (e.g. 640),
+            letterbox - pad downscaled frames to a square model input,
+            roi - "x,y,w,h" region of the frame which is sent to inference,
+            gate_hash_distance - roi frames closer than it to the last sent one are skipped (0 - off, default),
+            gate_black_level - darker roi frames are skipped (0 - off, default),
+            gate_blur_var - blurrier roi frames are skipped (0 - off, default)
         """
 
         log.debug(
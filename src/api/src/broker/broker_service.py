@@ -1,15 +1,73 @@
+import atexit
 import json
+import os
+import threading
+
 from src.broker.broker_producer_conf import producer_config
 from confluent_kafka import Producer
 from src.logger import log
 
+PRODUCER_FLUSH_TIMEOUT = 10
+
+_producer = None
+_producer_pid = None
+_producer_lock = threading.Lock()
+
+
+def get_producer() -> Producer:
+    """
+        one producer per process, shared by all the Broker objects, so the
+        connection and the batches are kept between the published events
+    """
+    global _producer, _producer_pid
+    with _producer_lock:
+        if _producer is None or _producer_pid != os.getpid():
+            _producer = Producer(**producer_config)
+            _producer_pid = os.getpid()
+            atexit.register(flush_producer)
+    return _producer
+
+
+def flush_producer(timeout: float = PRODUCER_FLUSH_TIMEOUT) -> int:
+    if _producer is None or _producer_pid != os.getpid():
+        return 0
+    not_delivered = _producer.flush(timeout)
+    if not_delivered:
+        log.error(f"{not_delivered} events are not delivered before flush timeout")
+    return not_delivered
+
+
+def _on_delivery(err, msg) -> None:
+    if err is not None:
+        log.error(
+            f"""failed to deliver event to topic: {msg.topic()}
+            with key: {msg.key()}
+            because of error: {err}""")
+
 
 class Broker:
     def __init__(self):
         self.producer = self._get_producer()
 
     def _get_producer(self):
-        return Producer(**producer_config)
+        return get_producer()
+
+    def flush(self, timeout: float = PRODUCER_FLUSH_TIMEOUT) -> int:
+        """
+            barrier which waits for the delivery of all the queued events
+        """
+        return flush_producer(timeout)
+
+    def __produce(self, topic: str, key: str, value: str) -> None:
+        try:
+            self.producer.produce(
+                topic, key=key, value=value, on_delivery=_on_delivery)
+        except BufferError:
+            # local queue is full, serve delivery reports to free it
+            self.producer.poll(1.0)
+            self.producer.produce(
+                topic, key=key, value=value, on_delivery=_on_delivery)
+        self.producer.poll(0)
 
     def publish_event(self, request, topic, state):
 
@@ -23,7 +81,7 @@ class Broker:
         try:
             _topic = topic
             current_state = state
-            self.producer.produce(
+            self.__produce(
                 _topic,
                 key=request.request_uuid,
                 value=json.dumps(
@@ -32,14 +90,14 @@ class Broker:
                         "event": request.event,
                         "request_uuid": request.request_uuid,
                         "stream_source": request.stream_source,
+                        "params": request.get_stream_params(),
                     }
                 )
             )
 
-            self.producer.flush()
             log.info(
                 f"""event: {request.event}
-                with request_uuid: {request.request_uuid} is published""")
+                with request_uuid: {request.request_uuid} is queued for publishing""")
 
         except Exception as ex:
             log.error(
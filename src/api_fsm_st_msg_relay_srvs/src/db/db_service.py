@@ -12,6 +12,14 @@ _env_file = find_dotenv(f'./.{os.getenv("ENV", "dev")}.env')
 load_dotenv(_env_file)
 
 
+def get_pred_counts_key(request_uuid: str) -> str:
+    return f"{request_uuid}:counts"
+
+
+def get_pred_recent_key(request_uuid: str) -> str:
+    return f"{request_uuid}:recent"
+
+
 class PredDatabase():
     def __init__(self):
         self.host = self._get_host()
@@ -44,14 +52,25 @@ class PredDatabase():
         db_partition = 0
         return db_partition
 
-    def get_pred_for_event(self, event: Event) -> str:
+    def get_pred_for_event(self, event: Event) -> dict:
         log.debug(f"get preds for event: {event.request_uuid}")
 
         _uuid = event.request_uuid
-        if self.conn.keys(_uuid):
-            pred = self.conn.get(_uuid)
-        else:
-            pred = ""
+        pipe = self.conn.pipeline(transaction=False)
+        pipe.hgetall(get_pred_counts_key(_uuid))
+        pipe.xrange(get_pred_recent_key(_uuid))
+        counts, recent = pipe.execute()
+
+        detected_objects = []
+        for _, fields in recent:
+            detected_objects.extend(fields.get(b"classes", b"").decode().split())
+
+        pred = {
+            "detected_objects": detected_objects,
+            "object_counts": {
+                name.decode(): int(count) for name, count in counts.items()
+            },
+        }
 
         log.debug(f"get preds: {pred} for event: {event.request_uuid}")
         return pred
@@ -89,16 +108,13 @@ class APIEventDatabase():
         db_partition = 0
         return db_partition
 
-    def save_update(self, pair: tuple[Event, str]):
+    def save_update(self, pair: tuple[Event, dict]):
         log.debug(
             f"update state for pair: event: {pair[0].request_uuid}, preds: {pair[1]}")
 
         event: Event = pair[0]
         preds = pair[1]
 
-        if isinstance(preds, bytes):
-            preds = preds.decode()
-
         request_state = {
             "request_uuid": "0",
             "init_startup": "0",
@@ -107,7 +123,8 @@ class APIEventDatabase():
             "in_shutdown_processing": "0",
             "active": "0",
             "inactive": "0",
-            "detected_objects": preds.split()
+            "detected_objects": preds["detected_objects"],
+            "object_counts": preds["object_counts"],
         }
         request_state[event.state] = "1"
         raw_request_state = json.dumps(request_state)
@@ -115,6 +132,16 @@ class APIEventDatabase():
 
 
 class FsmStateDatabase():
+    """
+        reads the new events in the order of their writing transaction
+
+        the writer lanes of the fsm stenographer commit concurrently, so an
+        event id can commit after a greater one is read. only the events of
+        the transactions below the xmin of the current snapshot are read,
+        no such transaction is running and no later one can get a lower
+        tx_id, so the (tx_id, event_id) cursor never skips an event
+    """
+
     def __init__(self):
         self.host = self._get_host()
         self.port = self._get_port()
@@ -122,6 +149,7 @@ class FsmStateDatabase():
         self.__password = self._get_db_password()
         self.database = self._get_db()
         self.conn = None
+        self.last_updated_tx_id = "0"
         self.last_updated_event_index = 0
 
         self.__init_tables()
@@ -170,17 +198,25 @@ class FsmStateDatabase():
             if _conn:
                 _curr = _conn.cursor()
                 rows = _curr.execute(
-                    f"""
-                    SELECT * FROM events WHERE event_id > {self.last_updated_event_index};
                     """
+                    SELECT event_id, request_uuid, state, event, stream_source, tx_id::text
+                    FROM events
+                    WHERE tx_id < pg_snapshot_xmin(pg_current_snapshot())
+                    AND (tx_id, event_id) > (%s::xid8, %s)
+                    ORDER BY tx_id, event_id
+                    ;
+                    """,
+                    (self.last_updated_tx_id, self.last_updated_event_index)
                 )
 
                 events = []
                 rows = _curr.fetchall()
+                # no read transaction is kept open between the polls
+                _conn.commit()
 
                 if len(rows) > 0:
                     for row in rows:
-                        event_id, request_uuid, state, event, stream_source = row
+                        event_id, request_uuid, state, event, stream_source, _ = row
                         event = Event(
                             request_uuid=request_uuid,
                             state=state,
@@ -190,12 +226,16 @@ class FsmStateDatabase():
                         events.append(event)
 
                     self.last_updated_event_index = int(rows[-1][0])
+                    self.last_updated_tx_id = rows[-1][5]
 
             return events
 
         except (Exception, psycopg2.DatabaseError) as ex:
             log.critical(
                 f"Error while connecting to db while insert/update action with exception: {ex}")
+            # an aborted transaction would fail every next poll
+            if self.conn and not self.conn.closed:
+                self.conn.rollback()
             return []
         finally:
             _curr.close()
@@ -207,7 +247,7 @@ class OutboxService:
         self.pred_db = PredDatabase()
         self.api_db = APIEventDatabase()
 
-    def get_pred_event_pairs(self) -> list[tuple[Event, str]]:
+    def get_pred_event_pairs(self) -> list[tuple[Event, dict]]:
         fsm_db = self.fsm_db
         events = fsm_db.get_current_events_updates()
         events_preds = []
@@ -217,7 +257,7 @@ class OutboxService:
             events_preds.append(pair)
         return events_preds
 
-    def _get_pred_by_request_uuid(self, event: Event) -> str:
+    def _get_pred_by_request_uuid(self, event: Event) -> dict:
         pred_db = self.pred_db
         pred = pred_db.get_pred_for_event(event)
         return pred
@@ -0,0 +1,133 @@
+"""
+    the outbox cursor against concurrent writer lanes of the fsm stenographer
+
+    needs a postgres 13+ of the FSM_POSTGRES_* envs, every test works in
+    its own schema, which is dropped after it
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+pytest.importorskip("redis")
+if "FSM_POSTGRES_DB_HOST" not in os.environ:
+    pytest.skip("FSM_POSTGRES_* envs are not set", allow_module_level=True)
+
+os.environ.setdefault("LOG_FILE_PATH", "/tmp/outbox_test.log")
+# the redis clients of the module connect lazily, they are not used here
+for _name, _value in (("PRED_REDIS_DB_HOST", "localhost"), ("PRED_REDIS_DB_PORT", "6379"),
+                      ("PRED_REDIS_HOST_PASSWORD", ""),
+                      ("API_REDIS_DB_HOST", "localhost"), ("API_REDIS_DB_PORT", "6379"),
+                      ("API_REDIS_HOST_PASSWORD", "")):
+    os.environ.setdefault(_name, _value)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from db.db_service import FsmStateDatabase  # noqa: E402
+
+
+def connect(schema: str):
+    conn = psycopg2.connect(
+        user=os.environ["FSM_POSTGRES_USER"],
+        password=os.environ["FSM_POSTGRES_PASSWORD"],
+        host=os.environ["FSM_POSTGRES_DB_HOST"],
+        port=os.environ["FSM_POSTGRES_DB_PORT"],
+        database=os.environ["FSM_POSTGRES_DB"],
+    )
+    with conn.cursor() as curr:
+        curr.execute(f"SET search_path TO {schema};")
+    conn.commit()
+    return conn
+
+
+def insert_event(conn, request_uuid: str, state: str) -> None:
+    with conn.cursor() as curr:
+        curr.execute(
+            """
+            INSERT INTO events (request_uuid, state, event, stream_source)
+            VALUES (%s, %s, 'shut_down', '')
+            ;
+            """,
+            (request_uuid, state)
+        )
+
+
+@pytest.fixture
+def schema():
+    schema = f"outbox_test_{uuid.uuid4().hex[:8]}"
+    conn = connect("public")
+    with conn.cursor() as curr:
+        curr.execute(f"CREATE SCHEMA {schema};")
+        curr.execute(
+            f"""
+            CREATE TABLE {schema}.events (
+            event_id         BIGSERIAL PRIMARY KEY,
+            request_uuid     VARCHAR (100) NOT NULL,
+            state            VARCHAR (100) NOT NULL,
+            event            VARCHAR (100) NOT NULL,
+            stream_source    VARCHAR (100) NOT NULL,
+            tx_id            xid8 NOT NULL DEFAULT pg_current_xact_id()
+            );
+            """
+        )
+    conn.commit()
+    yield schema
+    with conn.cursor() as curr:
+        curr.execute(f"DROP SCHEMA {schema} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def fsm_db(schema):
+    fsm_db = FsmStateDatabase()
+    with fsm_db.conn.cursor() as curr:
+        curr.execute(f"SET search_path TO {schema};")
+    fsm_db.conn.commit()
+    yield fsm_db
+    fsm_db.conn.close()
+
+
+def read_states(fsm_db: FsmStateDatabase) -> list[tuple[str, str]]:
+    return [(event.request_uuid, event.state)
+            for event in fsm_db.get_current_events_updates()]
+
+
+def test_lower_event_id_committed_later_is_not_skipped(schema, fsm_db):
+    lane_a, lane_b = connect(schema), connect(schema)
+
+    # lane a takes the lower event id, lane b commits first
+    insert_event(lane_a, "request_a", "inactive")
+    insert_event(lane_b, "request_b", "active")
+    lane_b.commit()
+
+    assert ("request_a", "inactive") not in read_states(fsm_db)
+
+    lane_a.commit()
+    read = read_states(fsm_db)
+
+    assert ("request_a", "inactive") in read
+    lane_a.close()
+    lane_b.close()
+
+
+def test_every_event_is_read_once_whatever_the_commit_order(schema, fsm_db):
+    lane_a, lane_b = connect(schema), connect(schema)
+
+    # lane b gets the older transaction, lane a the lower event id
+    with lane_b.cursor() as curr:
+        curr.execute("SELECT pg_current_xact_id();")
+    insert_event(lane_a, "request_a", "inactive")
+    insert_event(lane_b, "request_b", "active")
+    lane_b.commit()
+
+    read = read_states(fsm_db)
+    lane_a.commit()
+    read += read_states(fsm_db)
+    read += read_states(fsm_db)
+
+    assert sorted(read) == [("request_a", "inactive"), ("request_b", "active")]
+    lane_a.close()
+    lane_b.close()
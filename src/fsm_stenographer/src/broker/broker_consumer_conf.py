@@ -9,6 +9,8 @@ class ConsumerConfig(object):
     def __init__(self):
         self.kafka_host = self._get_host()
         self.kafka_port = self._get_port()
+        self.batch_size = self._get_batch_size()
+        self.batch_timeout = self._get_batch_timeout()
 
     def _get_host(self):
         host = os.environ['KAFKA_BROKER_HOST']
@@ -18,14 +20,32 @@ class ConsumerConfig(object):
         port = os.environ['KAFKA_BROKER_PORT']
         return port
 
+    def _get_batch_size(self):
+        batch_size = int(os.environ.get('KAFKA_CONSUME_BATCH_SIZE', 100))
+        return batch_size
+
+    def _get_batch_timeout(self):
+        timeout = float(os.environ.get('KAFKA_CONSUME_TIMEOUT', 1.0))
+        return timeout
+
+    def get_batch_config(self) -> dict[str:str]:
+        config = {
+            "max_messages": self.batch_size,
+            "timeout": self.batch_timeout,
+        }
+        return config
+
     def get_config(self) -> dict[str:str]:
         config = {
             "bootstrap.servers": f"{self.kafka_host}:{self.kafka_port}",
             'group.id': 'fsm-stenographer',
-            'auto.offset.reset': 'smallest'
+            'auto.offset.reset': 'smallest',
+            # offsets are committed only after the events are written to db
+            'enable.auto.commit': False,
         }
         return config
 
 
 _config_manager = ConsumerConfig()
 consumer_config = _config_manager.get_config()
+consume_batch_config = _config_manager.get_batch_config()
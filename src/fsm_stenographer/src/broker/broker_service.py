@@ -1,11 +1,97 @@
+import atexit
 import json
+import os
+import threading
+from collections import OrderedDict
 
 from broker.broker_producer_conf import producer_config
-from broker.broker_consumer_conf import consumer_config
+from broker.broker_consumer_conf import consumer_config, consume_batch_config
 from fsm_stenographer_models import Event
 from logger import log
 
-from confluent_kafka import Producer, Consumer, KafkaError, KafkaException
+from confluent_kafka import (
+    Producer, Consumer, KafkaError, KafkaException, TopicPartition, TIMESTAMP_NOT_AVAILABLE
+)
+
+PRODUCER_FLUSH_TIMEOUT = 10
+
+_producer = None
+_producer_pid = None
+_producer_lock = threading.Lock()
+
+
+def get_producer() -> Producer:
+    """
+        one producer per process, shared by all the Broker objects, so the
+        connection and the batches are kept between the published events
+    """
+    global _producer, _producer_pid
+    with _producer_lock:
+        if _producer is None or _producer_pid != os.getpid():
+            _producer = Producer(**producer_config)
+            _producer_pid = os.getpid()
+            atexit.register(flush_producer)
+    return _producer
+
+
+def flush_producer(timeout: float = PRODUCER_FLUSH_TIMEOUT) -> int:
+    if _producer is None or _producer_pid != os.getpid():
+        return 0
+    not_delivered = _producer.flush(timeout)
+    if not_delivered:
+        log.error(f"{not_delivered} events are not delivered before flush timeout")
+    return not_delivered
+
+
+def _on_delivery(err, msg) -> None:
+    if err is not None:
+        log.error(
+            f"""failed to deliver event to topic: {msg.topic()}
+            with key: {msg.key()}
+            because of error: {err}""")
+
+
+class OffsetTracker():
+    """
+        offsets of the consumed messages per partition in consume order
+
+        a partition can be committed only up to its first offset which is
+        not done, so a batch written late is never skipped by the commit
+        of a later one
+    """
+
+    def __init__(self):
+        self.partitions: dict[tuple[str, int]:OrderedDict[int:bool]] = {}
+        self._lock = threading.Lock()
+
+    def track(self, topic: str, partition: int, offset: int) -> None:
+        with self._lock:
+            offsets = self.partitions.setdefault((topic, partition), OrderedDict())
+            offsets[offset] = False
+
+    def done(self, topic: str, partition: int, offset: int) -> None:
+        with self._lock:
+            offsets = self.partitions.get((topic, partition))
+            # the partition may be revoked while the event was written
+            if offsets is not None and offset in offsets:
+                offsets[offset] = True
+
+    def pop_committable(self) -> list[TopicPartition]:
+        committable = []
+        with self._lock:
+            for (topic, partition), offsets in self.partitions.items():
+                last_done = None
+                while offsets and next(iter(offsets.values())):
+                    last_done, _ = offsets.popitem(last=False)
+                if last_done is not None:
+                    # the committed offset is the next one to consume
+                    committable.append(TopicPartition(topic, partition, last_done + 1))
+        return committable
+
+    def forget(self, partitions: list[TopicPartition]) -> None:
+        with self._lock:
+            for tp in partitions:
+                self.partitions.pop((tp.topic, tp.partition), None)
 
 
 class Broker:
@@ -13,15 +99,35 @@ class Broker:
         self.producer = self._get_producer()
         self.consumer = self._get_consumer()
         self.topics = topics
+        self.is_paused = False
+        self.offset_tracker = OffsetTracker()
 
-        self.consumer.subscribe(self.topics)
+        self.consumer.subscribe(
+            self.topics, on_assign=self.__on_assign, on_revoke=self.__on_revoke)
 
     def __del__(self):
         if self.consumer:
             self.consumer.close()
 
     def _get_producer(self):
-        return Producer(**producer_config)
+        return get_producer()
+
+    def flush(self, timeout: float = PRODUCER_FLUSH_TIMEOUT) -> int:
+        """
+            barrier which waits for the delivery of all the queued events
+        """
+        return flush_producer(timeout)
+
+    def __produce(self, topic: str, key: str, value: str) -> None:
+        try:
+            self.producer.produce(
+                topic, key=key, value=value, on_delivery=_on_delivery)
+        except BufferError:
+            # local queue is full, serve delivery reports to free it
+            self.producer.poll(1.0)
+            self.producer.produce(
+                topic, key=key, value=value, on_delivery=_on_delivery)
+        self.producer.poll(0)
 
     def _get_consumer(self):
         return Consumer(**consumer_config)
@@ -38,6 +144,87 @@ class Broker:
         event = self.__assemble_event_from_message(message)
         return event
 
+    def consume_events(self,
+                       max_messages: int = consume_batch_config["max_messages"],
+                       timeout: float = consume_batch_config["timeout"]) -> list[Event]:
+        """
+            returns up to max_messages events which are available within
+            timeout, an empty list if there are none
+        """
+        msgs = self.consumer.consume(num_messages=max_messages, timeout=timeout)
+
+        events = []
+        for msg in msgs:
+            if msg.error():
+                self.__process_broker_batch_error(msg)
+                continue
+
+            self.offset_tracker.track(msg.topic(), msg.partition(), msg.offset())
+            try:
+                message = self.__broker_msg_to_py_obj(msg)
+                event = self.__assemble_event_from_message(message)
+            except (ValueError, KeyError) as ex:
+                log.error(
+                    f"invalid message at {msg.topic()} [{msg.partition()}] offset {msg.offset()}: {ex}")
+                # nothing to write, it must not hold back the commit
+                self.offset_tracker.done(msg.topic(), msg.partition(), msg.offset())
+                continue
+
+            event.topic = msg.topic()
+            event.partition = msg.partition()
+            event.offset = msg.offset()
+            timestamp_type, timestamp_ms = msg.timestamp()
+            if timestamp_type != TIMESTAMP_NOT_AVAILABLE:
+                # the same for every delivery of the message
+                event.created_at = timestamp_ms / 1000.0
+            events.append(event)
+        return events
+
+    def mark_events_done(self, events: list[Event]) -> None:
+        """marks events as written, their offsets can be committed"""
+        for event in events:
+            self.offset_tracker.done(event.topic, event.partition, event.offset)
+
+    def commit_done_offsets(self) -> None:
+        offsets = self.offset_tracker.pop_committable()
+        if not offsets:
+            return
+        try:
+            self.consumer.commit(offsets=offsets, asynchronous=False)
+        except KafkaException as ex:
+            # the events are written idempotently, they are only
+            # consumed and written once more after a restart
+            log.error(f"failed to commit offsets: {offsets} because of ex: {ex}")
+
+    def __on_assign(self, consumer, partitions: list[TopicPartition]) -> None:
+        self.offset_tracker.forget(partitions)
+
+    def __on_revoke(self, consumer, partitions: list[TopicPartition]) -> None:
+        # not committed offsets of the revoked partitions are consumed
+        # again by their next owner
+        self.offset_tracker.forget(partitions)
+
+    def pause(self) -> None:
+        """
+            stops fetching from the assigned partitions, the consumer keeps
+            polling, so it stays in the group while the service catches up
+        """
+        assignment = self.consumer.assignment()
+        if assignment:
+            self.consumer.pause(assignment)
+            if not self.is_paused:
+                log.warning(f"consumption of {self.topics} is paused")
+            self.is_paused = True
+
+    def resume(self) -> None:
+        if not self.is_paused:
+            return
+        assignment = self.consumer.assignment()
+        if assignment:
+            self.consumer.resume(assignment)
+        self.is_paused = False
+        log.warning(f"consumption of {self.topics} is resumed")
+
     def __assemble_event_from_message(self, message: dict[str:str]):
         event = Event(
             event=message["event"],
@@ -59,6 +246,15 @@ class Broker:
             elif msg.error():
                 raise KafkaException(msg.error())
 
+    def __process_broker_batch_error(self, msg) -> None:
+        # one broken message must not drop the rest of the batch
+        if msg.error().fatal():
+            raise KafkaException(msg.error())
+        try:
+            self.__process_broker_error(msg)
+        except KafkaException as ex:
+            log.error(f"failed to consume message because of ex: {ex}")
+
     def publish_event(self, event: Event, topic: str, state: str) -> None:
 
         log.debug(f"""try to publish event: {event.event}
@@ -72,9 +268,9 @@ class Broker:
         try:
             _topic = topic
             current_state = state
-            self.producer.produce(
+            self.__produce(
                 _topic,
-                key=event.event_uuid,
+                key=event.request_uuid,
                 value=json.dumps(
                     {
                         "state": current_state,
@@ -85,13 +281,12 @@ class Broker:
                 )
             )
 
-            self.producer.flush()
             log.info(
                 f"""event: {event.event} 
-                with event_uuid: {event.request_uuid} is published""")
+                with event_uuid: {event.request_uuid} is queued for publishing""")
 
         except Exception as ex:
             log.error(
                 f"""failed to publish event: {event.event} 
-                with event_uuid: {event.event_uuid} 
+                with event_uuid: {event.request_uuid} 
                 because of exception: {ex}""")
@@ -1,14 +1,31 @@
 import os
+import re
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from time import sleep
 from dotenv import load_dotenv, find_dotenv
 from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
+from psycopg2 import sql
 import psycopg2
 
 from fsm_stenographer_models import Event
+from metrics import metrics
 from logger import log
 
 _env_file = find_dotenv(f'./.{os.getenv("ENV", "dev")}.env')
 load_dotenv(_env_file)
 
+# rows per statement of execute_values, all pages share the transaction
+WRITE_PAGE_SIZE = 1000
+SCHEMA_LOCK_ID = 7_341_001
+EVENTS_PARTITION_PATTERN = re.compile(r"^events_p(\d{8})$")
+EVENTS_RETENTION_MODES = ("drop", "detach")
+
+
+def get_events_partition_name(day: date) -> str:
+    return f"events_p{day:%Y%m%d}"
+
 
 class Database():
     def __init__(self):
@@ -17,6 +34,10 @@ class Database():
         self.__user = self._get_db_user()
         self.__password = self._get_db_password()
         self.database = self._get_db()
+        self.events_retention_days = self._get_events_retention_days()
+        self.events_retention_mode = self._get_events_retention_mode()
+        self.events_premake_days = self._get_events_premake_days()
+        self.events_maintenance_interval_s = self._get_events_maintenance_interval_s()
         self.conn_pool = None
         self.is_ready = self.__init_tables()
         if self.is_ready:
@@ -46,6 +67,28 @@ class Database():
         basic_db = os.environ['POSTGRES_DB']
         return basic_db
 
+    def _get_events_retention_days(self):
+        retention_days = int(os.environ.get('FSM_EVENTS_RETENTION_DAYS', 30))
+        if retention_days < 1:
+            raise ValueError(
+                f"Invalid events retention days: {retention_days}, must be >= 1")
+        return retention_days
+
+    def _get_events_retention_mode(self):
+        retention_mode = os.environ.get('FSM_EVENTS_RETENTION_MODE', "drop")
+        if retention_mode not in EVENTS_RETENTION_MODES:
+            raise ValueError(
+                f"Invalid events retention mode: {retention_mode}, expected one of: {EVENTS_RETENTION_MODES}")
+        return retention_mode
+
+    def _get_events_premake_days(self):
+        premake_days = int(os.environ.get('FSM_EVENTS_PREMAKE_DAYS', 3))
+        return premake_days
+
+    def _get_events_maintenance_interval_s(self):
+        interval_s = float(os.environ.get('FSM_EVENTS_MAINTENANCE_INTERVAL_S', 3600))
+        return interval_s
+
     def __init_tables(self):
         try:
             self.conn_pool = ThreadedConnectionPool(
@@ -59,82 +102,426 @@ class Database():
             )
 
             _conn = self.conn_pool.getconn()
+            try:
+                with _conn.cursor() as _curr:
+                    # the instances of the service start together,
+                    # only one of them creates or migrates the schema
+                    _curr.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_ID,))
+                    _curr.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS request_state (
+                        request_uuid   VARCHAR (100) PRIMARY KEY,
+                        state          VARCHAR (100) NOT NULL,
+                        event         VARCHAR (100) NOT NULL,
+                        stream_source  VARCHAR (100) NOT NULL
+                        );
+                        """
+                    )
 
-            if _conn:
-                _curr = _conn.cursor()
-                _curr.execute(
-                    f"""
-                    CREATE TABLE IF NOT EXISTS request_state (
-                    request_uuid   VARCHAR (100) PRIMARY KEY,
-                    state          VARCHAR (100) NOT NULL,
-                    event         VARCHAR (100) NOT NULL,
-                    stream_source  VARCHAR (100) NOT NULL
-                    );
-                    """
-                )
-                _curr.execute(
-                    f"""
-                    CREATE TABLE IF NOT EXISTS events (
-                    event_id       SERIAL PRIMARY KEY,
-                    request_uuid   VARCHAR (100) NOT NULL,
-                    state          VARCHAR (100) NOT NULL,
-                    event         VARCHAR (100) NOT NULL,
-                    stream_source  VARCHAR (100) NOT NULL
-                    );
-                    """
-                )
+                    events_kind = self.__get_events_table_kind(_curr)
+                    if events_kind == "r":
+                        self.__rename_legacy_events_table(_curr)
+                    if events_kind != "p":
+                        self.__create_events_table(_curr)
+                    self.__add_events_tx_id(_curr)
+                    if events_kind == "r":
+                        self.__migrate_legacy_events(_curr)
                 _conn.commit()
+            except Exception:
+                _conn.rollback()
+                raise
+            finally:
                 self.conn_pool.putconn(_conn)
-            else:
-                return False
+
+            self.maintain_events_partitions()
             return True
 
         except (Exception, psycopg2.DatabaseError) as ex:
             log.critical(
                 f"Error while connecting to db while init action with exception: {ex}")
-        finally:
             return False
 
+    def __get_events_table_kind(self, _curr) -> str | None:
+        """r for the plain table of the older versions, p for the partitioned one"""
+        _curr.execute(
+            """
+            SELECT c.relkind FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relname = 'events' AND n.nspname = current_schema()
+            ;
+            """
+        )
+        row = _curr.fetchone()
+        return row[0] if row else None
+
+    def __create_events_table(self, _curr) -> None:
+        # the kafka position with the kafka timestamp of the message makes
+        # the inserts idempotent, the partition key must be in every unique
+        # index, so created_at is the timestamp and not the insert time
+        _curr.execute(
+            """
+            CREATE TABLE events (
+            event_id         BIGSERIAL,
+            request_uuid     VARCHAR (100) NOT NULL,
+            state            VARCHAR (100) NOT NULL,
+            event            VARCHAR (100) NOT NULL,
+            stream_source    VARCHAR (100) NOT NULL,
+            kafka_topic      VARCHAR (255),
+            kafka_partition  INTEGER,
+            kafka_offset     BIGINT,
+            created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (event_id, created_at)
+            ) PARTITION BY RANGE (created_at)
+            ;
+            """
+        )
+        _curr.execute(
+            """
+            CREATE UNIQUE INDEX events_kafka_position_idx
+            ON events (kafka_topic, kafka_partition, kafka_offset, created_at)
+            ;
+            """
+        )
+        _curr.execute(
+            """
+            CREATE INDEX events_request_uuid_event_id_idx
+            ON events (request_uuid, event_id)
+            ;
+            """
+        )
+        # rows out of the range of the daily partitions, from skewed
+        # clocks or replays of old messages, must not fail the batch
+        _curr.execute(
+            """
+            CREATE TABLE events_default PARTITION OF events DEFAULT
+            ;
+            """
+        )
+
+    def __add_events_tx_id(self, _curr) -> None:
+        """
+            the writer lanes commit concurrently, so the event ids commit
+            out of order, the outbox reads the events in the order of the
+            writing transaction and only the transactions which can not
+            be running anymore. the rows present when the column is added
+            get 0, the rows written later, also the ones copied by
+            __migrate_legacy_events, get the xid of their writing transaction
+        """
+        _curr.execute(
+            """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema()
+            AND table_name = 'events' AND column_name = 'tx_id'
+            ;
+            """
+        )
+        if _curr.fetchone():
+            return
+
+        _curr.execute(
+            """
+            ALTER TABLE events ADD COLUMN tx_id xid8 NOT NULL DEFAULT '0';
+            ALTER TABLE events ALTER COLUMN tx_id SET DEFAULT pg_current_xact_id();
+            CREATE INDEX events_tx_id_event_id_idx ON events (tx_id, event_id);
+            """
+        )
+
+    def __rename_legacy_events_table(self, _curr) -> None:
+        _curr.execute(
+            """
+            ALTER TABLE events RENAME TO events_legacy;
+            ALTER TABLE events_legacy RENAME CONSTRAINT events_pkey TO events_legacy_pkey;
+            ALTER INDEX IF EXISTS events_kafka_position_idx RENAME TO events_legacy_kafka_position_idx;
+            ALTER SEQUENCE IF EXISTS events_event_id_seq RENAME TO events_legacy_event_id_seq;
+            """
+        )
+
+    def __migrate_legacy_events(self, _curr) -> None:
+        """
+            moves the rows of the plain table into a partition of the day
+            before the migration, it is dropped by the retention as a
+            partition of that day, event ids are kept, so the outbox
+            continues from the same event id
+        """
+        today = datetime.now(timezone.utc).date()
+        legacy_day = today - timedelta(days=1)
+        legacy_created_at = datetime.combine(today, time.min, timezone.utc) - timedelta(microseconds=1)
+
+        _curr.execute(
+            sql.SQL(
+                """
+                CREATE TABLE {partition} PARTITION OF events
+                FOR VALUES FROM (MINVALUE) TO ({upper})
+                ;
+                """
+            ).format(
+                partition=sql.Identifier(get_events_partition_name(legacy_day)),
+                upper=sql.Literal(datetime.combine(today, time.min, timezone.utc)),
+            )
+        )
+        # rows of the versions before the kafka positions
+        _curr.execute(
+            """
+            ALTER TABLE events_legacy
+            ADD COLUMN IF NOT EXISTS kafka_topic     VARCHAR (255),
+            ADD COLUMN IF NOT EXISTS kafka_partition INTEGER,
+            ADD COLUMN IF NOT EXISTS kafka_offset    BIGINT
+            ;
+            """
+        )
+        _curr.execute(
+            """
+            INSERT INTO events (event_id, request_uuid, state, event, stream_source,
+                                kafka_topic, kafka_partition, kafka_offset, created_at)
+            SELECT event_id, request_uuid, state, event, stream_source,
+                   kafka_topic, kafka_partition, kafka_offset, %s
+            FROM events_legacy
+            ;
+            """,
+            (legacy_created_at,)
+        )
+        _curr.execute(
+            """
+            SELECT setval(
+                pg_get_serial_sequence('events', 'event_id'),
+                GREATEST((SELECT max(event_id) FROM events), 1)
+            );
+            """
+        )
+        _curr.execute("DROP TABLE events_legacy;")
+        log.warning(f"legacy events table is migrated to partition of {legacy_day}")
+
+    def maintain_events_partitions(self) -> None:
+        """
+            creates the daily partitions of the next premake days and drops
+            or detaches the ones older than the retention, every partition
+            is changed in its own transaction
+        """
+        today = datetime.now(timezone.utc).date()
+        cutoff = today - timedelta(days=self.events_retention_days)
+
+        for day_offset in range(self.events_premake_days + 1):
+            self.__run_partition_ddl(self.__create_events_partition,
+                                     today + timedelta(days=day_offset))
+
+        for partition, day in self.__get_events_partitions():
+            # the partition of a day holds the rows until the next day
+            if day + timedelta(days=1) <= cutoff:
+                self.__run_partition_ddl(self.__retire_events_partition, partition)
+
+        self.__run_partition_ddl(self.__clear_default_events_partition, cutoff)
+        self.__run_partition_ddl(self.__report_default_events_partition, None)
+
+    def __run_partition_ddl(self, action, arg) -> None:
+        _conn = self.conn_pool.getconn()
+        try:
+            with _conn.cursor() as _curr:
+                action(_curr, arg)
+            _conn.commit()
+        except (Exception, psycopg2.DatabaseError) as ex:
+            _conn.rollback()
+            metrics.inc("fsm_events_partition_failures")
+            log.critical(
+                f"Error while maintenance of events partitions: {arg} with exception: {ex}")
+        finally:
+            self.conn_pool.putconn(_conn)
+
+    def __create_events_partition(self, _curr, day: date) -> None:
+        """
+            the rows of the day which were written before its partition are
+            in the default partition, the partition can not be created over
+            them, so they are moved into it in the same transaction
+        """
+        partition = get_events_partition_name(day)
+        _curr.execute("SELECT to_regclass(%s);", (partition,))
+        if _curr.fetchone()[0] is not None:
+            return
+
+        lower = datetime.combine(day, time.min, timezone.utc)
+        upper = datetime.combine(day + timedelta(days=1), time.min, timezone.utc)
+        _curr.execute("CREATE TEMP TABLE events_moved (LIKE events) ON COMMIT DROP;")
+        _curr.execute(
+            """
+            WITH moved AS (
+                DELETE FROM events_default
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO events_moved SELECT * FROM moved
+            ;
+            """,
+            (lower, upper)
+        )
+        moved = _curr.rowcount
+
+        _curr.execute(
+            sql.SQL(
+                """
+                CREATE TABLE {partition} PARTITION OF events
+                FOR VALUES FROM ({lower}) TO ({upper})
+                ;
+                """
+            ).format(
+                partition=sql.Identifier(partition),
+                lower=sql.Literal(lower),
+                upper=sql.Literal(upper),
+            )
+        )
+        if moved:
+            # event ids and tx ids are kept, the outbox has read them already
+            _curr.execute("INSERT INTO events SELECT * FROM events_moved;")
+            log.warning(
+                f"{moved} events are moved from the default partition to: {partition}")
+
+    def __report_default_events_partition(self, _curr, _) -> None:
+        # rows stay in the default partition only out of the daily ranges,
+        # a growing count means the partitions are not created in time
+        _curr.execute("SELECT count(*) FROM events_default;")
+        rows = _curr.fetchone()[0]
+        metrics.set_gauge("fsm_events_default_rows", rows)
+        if rows:
+            log.warning(f"default events partition holds {rows} rows")
+
+    def __get_events_partitions(self) -> list[tuple[str, date]]:
+        _conn = self.conn_pool.getconn()
+        try:
+            with _conn.cursor() as _curr:
+                _curr.execute(
+                    """
+                    SELECT c.relname FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    JOIN pg_class p ON p.oid = i.inhparent
+                    WHERE p.relname = 'events'
+                    ;
+                    """
+                )
+                names = [row[0] for row in _curr.fetchall()]
+            _conn.commit()
+        finally:
+            self.conn_pool.putconn(_conn)
+
+        partitions = []
+        for name in names:
+            matched = EVENTS_PARTITION_PATTERN.match(name)
+            if matched:
+                partitions.append(
+                    (name, datetime.strptime(matched.group(1), "%Y%m%d").date()))
+        return partitions
+
+    def __retire_events_partition(self, _curr, partition: str) -> None:
+        if self.events_retention_mode == "detach":
+            # the detached table stays for archiving, out of the scans
+            _curr.execute(
+                sql.SQL("ALTER TABLE events DETACH PARTITION {partition};").format(
+                    partition=sql.Identifier(partition)))
+        else:
+            _curr.execute(
+                sql.SQL("DROP TABLE {partition};").format(
+                    partition=sql.Identifier(partition)))
+        log.warning(f"events partition: {partition} is retired by {self.events_retention_mode}")
+
+    def __clear_default_events_partition(self, _curr, cutoff: date) -> None:
+        _curr.execute(
+            "DELETE FROM events_default WHERE created_at < %s;",
+            (datetime.combine(cutoff, time.min, timezone.utc),)
+        )
+
+    def start_events_partitions_maintenance(self) -> None:
+        if not self.is_ready:
+            return
+        worker = threading.Thread(
+            target=self.__run_events_partitions_maintenance,
+            name="events_partitions_maintenance",
+            daemon=True,
+        )
+        worker.start()
+
+    def __run_events_partitions_maintenance(self) -> None:
+        while True:
+            sleep(self.events_maintenance_interval_s)
+            try:
+                self.maintain_events_partitions()
+            except (Exception, psycopg2.DatabaseError) as ex:
+                log.critical(f"Error while maintenance of events partitions with exception: {ex}")
+
     def __is_healthy(self, val: int):
         val = str(val)
         os.environ["HEALTHY"] = val
 
     def update_state_table_with_event(self, event: Event):
+        return self.update_state_table_with_events([event])
+
+    def update_state_table_with_events(self, events: list[Event]) -> bool:
+        """
+            upserts the last state of every request and inserts all the
+            events of the batch in one transaction, returns if it is committed
+        """
+        # one statement can not update the same row twice,
+        # the last event of a request wins as it would in order
+        last_events: dict[str:Event] = {}
+        for event in events:
+            last_events[event.request_uuid] = event
+
+        _conn = None
         try:
             _conn = self.conn_pool.getconn()
 
-            if _conn:
-                _curr = _conn.cursor()
-                _curr.execute(
-                    f"""
+            with _conn.cursor() as _curr:
+                execute_values(
+                    _curr,
+                    """
                     INSERT INTO request_state (request_uuid, state, event, stream_source)
-                    VALUES ('{event.request_uuid}', '{event.state}', '{event.event}', '{event.stream_source}')
+                    VALUES %s
                     ON CONFLICT (request_uuid)
-                    DO UPDATE 
+                    DO UPDATE
                     SET
                     state = EXCLUDED.state,
                     event = EXCLUDED.event
                     ;
-                    """
+                    """,
+                    [(event.request_uuid, event.state, event.event, event.stream_source)
+                     for event in last_events.values()],
+                    page_size=WRITE_PAGE_SIZE,
                 )
-                _curr.execute(
-                    f"""
-                    INSERT INTO events (event_id, request_uuid, state, event, stream_source)
-                    VALUES (DEFAULT ,'{event.request_uuid}', '{event.state}', '{event.event}', '{event.stream_source}');
+                execute_values(
+                    _curr,
                     """
+                    INSERT INTO events (request_uuid, state, event, stream_source,
+                                        kafka_topic, kafka_partition, kafka_offset,
+                                        created_at)
+                    VALUES %s
+                    ON CONFLICT (kafka_topic, kafka_partition, kafka_offset, created_at)
+                    DO NOTHING
+                    ;
+                    """,
+                    [(event.request_uuid, event.state, event.event, event.stream_source,
+                      *self.__get_kafka_position(event),
+                      event.created_at or datetime.now(timezone.utc).timestamp())
+                     for event in events],
+                    template="(%s, %s, %s, %s, %s, %s, %s, to_timestamp(%s))",
+                    page_size=WRITE_PAGE_SIZE,
                 )
-                _conn.commit()
-            self.conn_pool.putconn(_conn)
+            _conn.commit()
 
-            log.critical(f"""update fsm state with event: {event.event}, 
-            request_uuid: {event.request_uuid},
-            state: {event.state},
-            stream_source: {event.stream_source}
-            """)
+            log.info(
+                f"update fsm state with {len(events)} events of {len(last_events)} requests")
+            return True
 
         except (Exception, psycopg2.DatabaseError) as ex:
+            if _conn:
+                _conn.rollback()
             log.critical(
                 f"Error while connecting to db while insert/update action with exception: {ex}")
+            return False
+        finally:
+            if _conn:
+                self.conn_pool.putconn(_conn)
+
+    def __get_kafka_position(self, event: Event) -> tuple:
+        # events which are not consumed from kafka are never deduplicated
+        if event.offset < 0:
+            return None, None, None
+        return event.topic, event.partition, event.offset
 
 
 db = Database()
@@ -7,3 +7,9 @@ class Event:
     state: str
     request_uuid: str
     stream_source: str
+    # position of the message the event is consumed from
+    topic: str = ""
+    partition: int = -1
+    offset: int = -1
+    # kafka timestamp of the message, epoch seconds
+    created_at: float = 0.0
@@ -1,8 +1,13 @@
-import threading
+from collections import deque
 
 from broker.broker_service import Broker
 from fsm_stenographer_models import Event
 from db.db_service import db
+from writer.writer_service import ShardedWriter
+from metrics import metrics
+
+# short, the consumer loop must keep polling while a lane is full
+SUBMIT_TIMEOUT_S = 0.05
 
 
 class FSMStenographer():
@@ -10,22 +15,45 @@ class FSMStenographer():
 
     def __init__(self, topics=_TOPICS):
         self.msg_broker = Broker(topics)
-
-    def read_and_process_event(self):
-        event: Event = self.msg_broker.consume_event()
-
-        if not event:
-            return
-
-        self._update_request_state_table_with_event(event)
-
-    def _update_request_state_table_with_event(self, event: Event) -> None:
-        event_th = threading.Thread(
-            target=db.update_state_table_with_event,
-            args=(event,),
-            daemon=True
+        db.start_events_partitions_maintenance()
+        self.batch_writer = ShardedWriter(
+            write_batch=db.update_state_table_with_events,
+            on_written=self.msg_broker.mark_events_done,
         )
-        event_th.start()
+        # consumed events which did not fit a full lane, in consume order
+        self.pending_events: deque[Event] = deque()
+
+    def read_and_process_events(self):
+        metrics.report_if_due()
+        self.msg_broker.commit_done_offsets()
+        self.__submit_pending_events()
+        self.__apply_backpressure()
+
+        events: list[Event] = self.msg_broker.consume_events()
+
+        self.pending_events.extend(events)
+        self.__submit_pending_events()
+
+    def __apply_backpressure(self):
+        # while a db outage fills the lanes, the consumer is paused but
+        # keeps polling, so it stays in the group within max.poll.interval.ms
+        if self.pending_events or self.batch_writer.is_saturated():
+            self.msg_broker.pause()
+        else:
+            self.msg_broker.resume()
+
+    def __submit_pending_events(self) -> None:
+        # stops at the first event which does not fit, so the events
+        # of a request are still submitted in the consume order
+        while self.pending_events:
+            if not self._update_request_state_table_with_event(self.pending_events[0]):
+                metrics.set_gauge("fsm_pending_events", len(self.pending_events))
+                return
+            self.pending_events.popleft()
+        metrics.set_gauge("fsm_pending_events", 0)
+
+    def _update_request_state_table_with_event(self, event: Event) -> bool:
+        return self.batch_writer.submit(event, timeout=SUBMIT_TIMEOUT_S)
 
 
 fsm_stenographer_service = FSMStenographer()
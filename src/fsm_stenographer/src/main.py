@@ -18,7 +18,7 @@ def main():
             )
             break
         try:
-            fsm_stenographer_service.read_and_process_event()
+            fsm_stenographer_service.read_and_process_events()
         except Exception as ex:
             log.warning(
                 f"fsm-stenographer server is stopped because of exception: {ex}"
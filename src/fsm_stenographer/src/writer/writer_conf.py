@@ -0,0 +1,60 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+# maxconn of the connection pool of the db
+MAX_WRITER_LANES = 10
+
+
+class WriterConfig(object):
+    def __init__(self):
+        self.max_batch_size = self._get_max_batch_size()
+        self.flush_interval_ms = self._get_flush_interval_ms()
+        self.max_queue = self._get_max_queue()
+        self.lanes = self._get_lanes()
+        self.coalesce_window_ms = self._get_coalesce_window_ms()
+
+    def _get_max_batch_size(self):
+        max_batch_size = int(os.environ.get('FSM_WRITE_BATCH_SIZE', 500))
+        if max_batch_size < 1:
+            raise ValueError(
+                f"Invalid write batch size: {max_batch_size}, must be >= 1")
+        return max_batch_size
+
+    def _get_flush_interval_ms(self):
+        flush_interval_ms = float(os.environ.get('FSM_WRITE_FLUSH_INTERVAL_MS', 200))
+        return flush_interval_ms
+
+    def _get_max_queue(self):
+        max_queue = int(os.environ.get('FSM_WRITE_MAX_QUEUE', 10_000))
+        return max_queue
+
+    def _get_lanes(self):
+        # every lane holds a pooled db connection while it writes
+        lanes = int(os.environ.get('FSM_WRITER_LANES', 4))
+        if not 1 <= lanes <= MAX_WRITER_LANES:
+            raise ValueError(
+                f"Invalid writer lanes: {lanes}, must be in [1, {MAX_WRITER_LANES}]")
+        return lanes
+
+    def _get_coalesce_window_ms(self):
+        # 0 disables coalescing, the outbox polls the events every 2 s,
+        # a longer window delays the updates of the detected objects
+        coalesce_window_ms = float(os.environ.get('FSM_COALESCE_WINDOW_MS', 2000))
+        return coalesce_window_ms
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "max_batch_size": self.max_batch_size,
+            "flush_interval_ms": self.flush_interval_ms,
+            "max_queue": self.max_queue,
+            "lanes": self.lanes,
+            "coalesce_window_ms": self.coalesce_window_ms,
+        }
+        return config
+
+
+_config_manager = WriterConfig()
+writer_config = _config_manager.get_config()
@@ -0,0 +1,217 @@
+import queue
+import threading
+import time
+import zlib
+from typing import Callable
+
+from writer.writer_conf import writer_config
+from fsm_stenographer_models import Event
+from metrics import metrics
+from logger import log
+
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+RETRY_DELAY_S = 0.5
+MAX_RETRY_DELAY_S = 30.0
+COALESCER_PRUNE_SIZE = 10_000
+
+
+class StateCoalescer():
+    """
+        drops the events which repeat the last written state and event
+        of their request within window_ms, the transitions and the first
+        repeat after the window are kept
+
+        state is per writer lane, the events of a request are always
+        coalesced by the same lane
+    """
+
+    def __init__(self, window_ms: float = writer_config["coalesce_window_ms"]):
+        self.window_s = window_ms / 1000.0
+        self.last_written: dict[str:tuple[str, str, float]] = {}
+
+    def coalesce(self, events: list[Event]) -> list[Event]:
+        if self.window_s <= 0:
+            return events
+
+        now = time.monotonic()
+        last_seen = {}
+        kept = []
+        for event in events:
+            state, event_type, written_at = last_seen.get(
+                event.request_uuid,
+                self.last_written.get(event.request_uuid, ("", "", 0.0)))
+
+            if ((event.state, event.event) == (state, event_type)
+                    and now - written_at < self.window_s):
+                continue
+
+            kept.append(event)
+            last_seen[event.request_uuid] = (event.state, event.event, now)
+
+        metrics.inc("fsm_coalesced_events", len(events) - len(kept))
+        return kept
+
+    def commit(self, events: list[Event]) -> None:
+        """remembers the written events, called after the transaction"""
+        if self.window_s <= 0:
+            return
+
+        now = time.monotonic()
+        for event in events:
+            self.last_written[event.request_uuid] = (event.state, event.event, now)
+
+        if len(self.last_written) > COALESCER_PRUNE_SIZE:
+            self.last_written = {
+                request_uuid: last for request_uuid, last in self.last_written.items()
+                if now - last[2] < self.window_s
+            }
+
+
+class BatchWriter():
+    """
+        collects consumed events into batches for one db transaction
+
+        a batch is written when it reaches max_batch_size or when the
+        oldest event in it waited flush_interval_ms, whichever comes first.
+        is_saturated turns on at 80% of max_queue and off at 50%, the
+        consumer loop uses it to pause and resume its kafka partitions
+
+        a failed batch is retried with a growing delay until it is written,
+        the writes are idempotent, on_written is called after the commit
+        with all the events of the batch, the coalesced ones included
+    """
+
+    def __init__(self,
+                 write_batch: Callable[[list[Event]], bool],
+                 on_written: Callable[[list[Event]], None] | None = None,
+                 max_batch_size: int = writer_config["max_batch_size"],
+                 flush_interval_ms: float = writer_config["flush_interval_ms"],
+                 max_queue: int = writer_config["max_queue"],
+                 name: str = "fsm_writer"):
+        self.write_batch = write_batch
+        self.on_written = on_written
+        self.coalescer = StateCoalescer()
+        self.max_batch_size = max_batch_size
+        self.flush_interval_s = flush_interval_ms / 1000.0
+        self.name = name
+        self.queue: queue.Queue[tuple[float, Event]] = queue.Queue(maxsize=max_queue)
+        self.high_watermark = max(int(max_queue * 0.8), 1)
+        self.low_watermark = int(max_queue * 0.5)
+        self._is_saturated = False
+        self.worker = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.worker.start()
+
+    def submit(self, event: Event, timeout: float | None = None) -> bool:
+        """
+            returns false when the queue stays full for timeout, the caller
+            keeps the event and must not block its consumer loop on it
+        """
+        try:
+            self.queue.put((time.monotonic(), event), timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    def is_saturated(self) -> bool:
+        qsize = self.queue.qsize()
+        if qsize >= self.high_watermark:
+            self._is_saturated = True
+        elif qsize <= self.low_watermark:
+            self._is_saturated = False
+        return self._is_saturated
+
+    def __collect_batch(self) -> list[Event]:
+        enqueued_at, event = self.queue.get()
+        batch = [event]
+        deadline = enqueued_at + self.flush_interval_s
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    _, event = self.queue.get(timeout=remaining)
+                else:
+                    _, event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(event)
+        return batch
+
+    def __run(self):
+        while True:
+            batch = self.__collect_batch()
+            metrics.observe(f"{self.name}_batch_size", len(batch), BATCH_SIZE_BUCKETS)
+
+            to_write = self.coalescer.coalesce(batch)
+            if to_write:
+                self.__write_until_done(to_write)
+                self.coalescer.commit(to_write)
+            if self.on_written is not None:
+                self.on_written(batch)
+
+    def __write_until_done(self, batch: list[Event]) -> None:
+        retry_delay_s = RETRY_DELAY_S
+        while True:
+            started_at = time.perf_counter()
+            try:
+                is_written = self.write_batch(batch)
+            except Exception as ex:
+                log.critical(f"batch of {len(batch)} events is failed because of ex: {ex}")
+                is_written = False
+            metrics.observe(f"{self.name}_write_seconds", time.perf_counter() - started_at)
+
+            if is_written:
+                return
+
+            # the queue fills up meanwhile and pauses the consumer
+            metrics.inc(f"{self.name}_failed_batches")
+            time.sleep(retry_delay_s)
+            retry_delay_s = min(retry_delay_s * 2, MAX_RETRY_DELAY_S)
+
+
+class ShardedWriter():
+    """
+        fixed set of single writer lanes, the events of a request always
+        go to the same lane, so they are written in the consume order,
+        while the lanes write the batches of the other requests in parallel
+
+        the producers key the events by request_uuid, so a request is also
+        bound to one kafka partition and more partitions give more requests
+        to spread over the lanes
+    """
+
+    def __init__(self,
+                 write_batch: Callable[[list[Event]], bool],
+                 on_written: Callable[[list[Event]], None] | None = None,
+                 lanes: int = writer_config["lanes"],
+                 max_batch_size: int = writer_config["max_batch_size"],
+                 flush_interval_ms: float = writer_config["flush_interval_ms"],
+                 max_queue: int = writer_config["max_queue"]):
+        self.lanes = [
+            BatchWriter(
+                write_batch=write_batch,
+                on_written=on_written,
+                max_batch_size=max_batch_size,
+                flush_interval_ms=flush_interval_ms,
+                max_queue=max(max_queue // lanes, 1),
+                name=f"fsm_writer_lane_{idx}",
+            )
+            for idx in range(lanes)
+        ]
+
+    def get_lane(self, request_uuid: str) -> BatchWriter:
+        # crc32 and not hash(), it must not change between the processes
+        return self.lanes[zlib.crc32(request_uuid.encode()) % len(self.lanes)]
+
+    def submit(self, event: Event, timeout: float | None = None) -> bool:
+        return self.get_lane(event.request_uuid).submit(event, timeout)
+
+    def qsize(self) -> int:
+        return sum(lane.qsize() for lane in self.lanes)
+
+    def is_saturated(self) -> bool:
+        # every lane is checked, so each updates its own hysteresis
+        return any([lane.is_saturated() for lane in self.lanes])
@@ -0,0 +1,100 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+from inference_models import AdaptiveLevel
+from model.model_conf import model_config
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+
+class AdaptiveConfig(object):
+    def __init__(self):
+        self.enabled = self._get_enabled()
+        self.levels = self._get_levels()
+        self.max_frame_age_s = self._get_max_frame_age_s()
+        self.max_queue_depth = self._get_max_queue_depth()
+        self.recover_ratio = self._get_recover_ratio()
+        self.step_down_hold_s = self._get_step_down_hold_s()
+        self.step_up_hold_s = self._get_step_up_hold_s()
+
+    def _get_enabled(self):
+        # off by default, the levels lower the resolution and skip frames
+        enabled = os.environ.get('INFERENCE_ADAPTIVE', "false").lower() in ("1", "true", "yes")
+        return enabled
+
+    def _get_levels(self):
+        """
+            levels from the best quality to the cheapest one, separated by ";",
+            every level is imgsz:model:skip, skip n keeps one of n frames
+        """
+        levels = os.environ.get('INFERENCE_ADAPTIVE_LEVELS', "")
+        if not levels:
+            return self.__get_default_levels()
+
+        parsed = []
+        for level in levels.split(";"):
+            if not level.strip():
+                continue
+            imgsz, model, skip = level.strip().split(":")
+            parsed.append(AdaptiveLevel(imgsz=int(imgsz), model=model, skip=int(skip)))
+
+        for level in parsed:
+            if level.model not in model_config["models"]:
+                raise ValueError(
+                    f"Invalid adaptive level model: {level.model}, expected one of: {model_config['models']}")
+            if level.imgsz < 32 or level.skip < 1:
+                raise ValueError(f"Invalid adaptive level: {level}")
+        return parsed
+
+    def __get_default_levels(self):
+        imgsz = model_config["imgsz"]
+        model = model_config["default_model"]
+        # model strides need a multiple of 32
+        reduced = max(imgsz * 3 // 4 // 32 * 32, 32)
+        half = max(imgsz // 2 // 32 * 32, 32)
+        return [
+            AdaptiveLevel(imgsz=imgsz, model=model, skip=1),
+            AdaptiveLevel(imgsz=reduced, model=model, skip=1),
+            AdaptiveLevel(imgsz=half, model=model, skip=2),
+            AdaptiveLevel(imgsz=half, model=model, skip=4),
+        ]
+
+    def _get_max_frame_age_s(self):
+        max_frame_age_s = float(os.environ.get('INFERENCE_SLO_FRAME_AGE_S', 5))
+        return max_frame_age_s
+
+    def _get_max_queue_depth(self):
+        max_queue_depth = int(os.environ.get('INFERENCE_SLO_QUEUE_DEPTH', 64))
+        return max_queue_depth
+
+    def _get_recover_ratio(self):
+        recover_ratio = float(os.environ.get('INFERENCE_ADAPTIVE_RECOVER_RATIO', 0.5))
+        if not 0 < recover_ratio < 1:
+            raise ValueError(
+                f"Invalid adaptive recover ratio: {recover_ratio}, must be in (0, 1)")
+        return recover_ratio
+
+    def _get_step_down_hold_s(self):
+        step_down_hold_s = float(os.environ.get('INFERENCE_ADAPTIVE_STEP_DOWN_HOLD_S', 2))
+        return step_down_hold_s
+
+    def _get_step_up_hold_s(self):
+        step_up_hold_s = float(os.environ.get('INFERENCE_ADAPTIVE_STEP_UP_HOLD_S', 15))
+        return step_up_hold_s
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "enabled": self.enabled,
+            "levels": self.levels,
+            "max_frame_age_s": self.max_frame_age_s,
+            "max_queue_depth": self.max_queue_depth,
+            "recover_ratio": self.recover_ratio,
+            "step_down_hold_s": self.step_down_hold_s,
+            "step_up_hold_s": self.step_up_hold_s,
+        }
+        return config
+
+
+_config_manager = AdaptiveConfig()
+adaptive_config = _config_manager.get_config()
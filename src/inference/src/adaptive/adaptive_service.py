@@ -0,0 +1,118 @@
+import threading
+import time
+
+from adaptive.adaptive_conf import adaptive_config
+from inference_models import AdaptiveLevel, Event
+from metrics import metrics
+from logger import log
+
+FRAME_AGE_SMOOTHING = 0.2
+
+
+class AdaptiveController():
+    """
+        steps the inference quality down when the service falls behind
+        its slo and back up when the load clears
+
+        the load is the depth of the queues of the service and the
+        smoothed age of the predicted frames since their capture. a level
+        is stepped down after step_down_hold_s over the slo and stepped up
+        only after step_up_hold_s under recover_ratio of it, the gap
+        between the two thresholds keeps the level from oscillating
+    """
+
+    def __init__(self,
+                 levels: list[AdaptiveLevel] = adaptive_config["levels"],
+                 enabled: bool = adaptive_config["enabled"],
+                 max_frame_age_s: float = adaptive_config["max_frame_age_s"],
+                 max_queue_depth: int = adaptive_config["max_queue_depth"],
+                 recover_ratio: float = adaptive_config["recover_ratio"],
+                 step_down_hold_s: float = adaptive_config["step_down_hold_s"],
+                 step_up_hold_s: float = adaptive_config["step_up_hold_s"]):
+        self.levels = levels
+        self.enabled = enabled
+        self.max_frame_age_s = max_frame_age_s
+        self.max_queue_depth = max_queue_depth
+        self.recover_ratio = recover_ratio
+        self.step_down_hold_s = step_down_hold_s
+        self.step_up_hold_s = step_up_hold_s
+
+        self.level_idx = 0
+        self.frame_age_s = 0.0
+        self.last_observed_at = 0.0
+        self.overloaded_since = None
+        self.underloaded_since = None
+        self.frame_counters: dict[str:int] = {}
+        self._lock = threading.Lock()
+        self.__report_level()
+
+    @property
+    def level(self) -> AdaptiveLevel:
+        return self.levels[self.level_idx]
+
+    def observe_frame_ages(self, frame_ages: list[float]) -> None:
+        with self._lock:
+            for frame_age in frame_ages:
+                self.frame_age_s += FRAME_AGE_SMOOTHING * (frame_age - self.frame_age_s)
+            if frame_ages:
+                self.last_observed_at = time.monotonic()
+        metrics.set_gauge("inference_frame_age_smoothed_seconds", self.frame_age_s)
+
+    def should_process(self, event: Event) -> bool:
+        """keeps one of skip frames of every request"""
+        skip = self.level.skip
+        if skip <= 1:
+            return True
+
+        with self._lock:
+            counter = self.frame_counters.get(event.request_uuid, 0)
+            self.frame_counters[event.request_uuid] = counter + 1
+        return counter % skip == 0
+
+    def clear(self, request_uuid: str) -> None:
+        with self._lock:
+            self.frame_counters.pop(request_uuid, None)
+
+    def update(self, queue_depth: int) -> None:
+        if not self.enabled:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self.last_observed_at > self.step_up_hold_s:
+                # no frames are predicted, the last age is not current
+                self.frame_age_s = 0.0
+
+            is_overloaded = (self.frame_age_s > self.max_frame_age_s
+                             or queue_depth > self.max_queue_depth)
+            is_underloaded = (self.frame_age_s < self.max_frame_age_s * self.recover_ratio
+                              and queue_depth < self.max_queue_depth * self.recover_ratio)
+
+            self.overloaded_since = (self.overloaded_since or now) if is_overloaded else None
+            self.underloaded_since = (self.underloaded_since or now) if is_underloaded else None
+
+            if (self.overloaded_since is not None
+                    and now - self.overloaded_since >= self.step_down_hold_s
+                    and self.level_idx < len(self.levels) - 1):
+                self.__set_level(self.level_idx + 1, queue_depth, now)
+            elif (self.underloaded_since is not None
+                    and now - self.underloaded_since >= self.step_up_hold_s
+                    and self.level_idx > 0):
+                self.__set_level(self.level_idx - 1, queue_depth, now)
+
+        metrics.set_gauge("inference_queue_depth", queue_depth)
+
+    def __set_level(self, level_idx: int, queue_depth: int, now: float) -> None:
+        log.warning(
+            f"""inference level is changed from {self.level_idx} to {level_idx}: {self.levels[level_idx]}
+            with frame age: {self.frame_age_s:.2f}s and queue depth: {queue_depth}""")
+        self.level_idx = level_idx
+        # the next step waits for the full hold period at the new level
+        self.overloaded_since = now if self.overloaded_since is not None else None
+        self.underloaded_since = now if self.underloaded_since is not None else None
+        self.__report_level()
+
+    def __report_level(self) -> None:
+        metrics.set_gauge("inference_adaptive_level", self.level_idx)
+        metrics.set_gauge("inference_adaptive_imgsz", self.level.imgsz)
+        metrics.set_gauge("inference_adaptive_skip", self.level.skip)
@@ -0,0 +1,39 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+
+class BatchingConfig(object):
+    def __init__(self):
+        self.max_batch_size = self._get_max_batch_size()
+        self.max_wait_ms = self._get_max_wait_ms()
+        self.max_queue = self._get_max_queue()
+
+    def _get_max_batch_size(self):
+        max_batch_size = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 8))
+        if max_batch_size < 1:
+            raise ValueError(
+                f"Invalid max batch size: {max_batch_size}, must be >= 1")
+        return max_batch_size
+
+    def _get_max_wait_ms(self):
+        max_wait_ms = float(os.environ.get('INFERENCE_MAX_BATCH_WAIT_MS', 20))
+        return max_wait_ms
+
+    def _get_max_queue(self):
+        max_queue = int(os.environ.get('INFERENCE_MAX_BATCH_QUEUE', 256))
+        return max_queue
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_queue": self.max_queue,
+        }
+        return config
+
+
+_config_manager = BatchingConfig()
+batching_config = _config_manager.get_config()
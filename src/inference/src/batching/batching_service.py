@@ -0,0 +1,78 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+from batching.batching_conf import batching_config
+from inference_models import FrameTask
+from metrics import metrics
+from logger import log
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class BatchScheduler():
+    """
+        collects frames of all the requests into batches for one model call
+
+        a batch is run when it reaches max_batch_size or when the oldest
+        frame in it waited max_wait_ms, whichever comes first
+    """
+
+    def __init__(self,
+                 run_batch: Callable[[list[FrameTask]], None],
+                 max_batch_size: int = batching_config["max_batch_size"],
+                 max_wait_ms: float = batching_config["max_wait_ms"],
+                 max_queue: int = batching_config["max_queue"]):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.queue: queue.Queue[FrameTask] = queue.Queue(maxsize=max_queue)
+        self.worker = threading.Thread(target=self.__run, daemon=True)
+        self.worker.start()
+
+    def submit(self, task: FrameTask, timeout: float | None = None) -> bool:
+        """returns false when the queue stays full for timeout"""
+        task.enqueued_at = time.monotonic()
+        try:
+            self.queue.put(task, timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    def __collect_batch(self) -> list[FrameTask]:
+        # the time the compute stage waits for the first frame,
+        # high values mean the pipeline is bound by the frame downloads
+        started_at = time.monotonic()
+        batch = [self.queue.get()]
+        metrics.observe("inference_compute_idle_seconds", time.monotonic() - started_at)
+        deadline = batch[0].enqueued_at + self.max_wait_s
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def __run(self):
+        while True:
+            batch = self.__collect_batch()
+
+            now = time.monotonic()
+            metrics.observe("inference_batch_size", len(batch), BATCH_SIZE_BUCKETS)
+            metrics.set_gauge("inference_batch_queue_size", self.queue.qsize())
+            for task in batch:
+                metrics.observe("inference_batch_queue_wait_seconds", now - task.enqueued_at)
+
+            try:
+                self.run_batch(batch)
+            except Exception as ex:
+                log.critical(f"batch of {len(batch)} frames is failed because of ex: {ex}")
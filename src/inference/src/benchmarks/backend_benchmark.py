@@ -0,0 +1,151 @@
+"""
+    compare inference backends on a folder of sample frames
+
+    usage (from the inference src dir):
+        python3 -m benchmarks.backend_benchmark ./frames --model yolov8n.pt
+
+    the torch backend is the reference, for every other backend the boxes
+    of a frame are matched to the reference ones of the same class by iou,
+    precision and recall are of the matched boxes, throughput is frames/s
+    of the batched predict after one warmup batch
+"""
+import argparse
+import pathlib
+import time
+
+import cv2
+import numpy as np
+
+from model.backend_service import load_model
+
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino", "openvino-int8")
+FRAME_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def read_frames(folder: str) -> list[np.ndarray]:
+    paths = sorted(path for path in pathlib.Path(folder).iterdir()
+                   if path.suffix.lower() in FRAME_SUFFIXES)
+    frames = [cv2.imread(str(path)) for path in paths]
+    return [frame for frame in frames if frame is not None]
+
+
+def parse_backend(name: str) -> tuple[str, bool]:
+    backend, _, quantization = name.partition("-")
+    return backend, quantization == "int8"
+
+
+def get_detections(res) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    boxes = res.boxes
+    return (boxes.cls.cpu().numpy().astype(int),
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy())
+
+
+def get_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def match_detections(reference, detections, iou_threshold: float) -> tuple[int, list[float]]:
+    ref_cls, ref_xyxy, ref_conf = reference
+    cls, xyxy, conf = detections
+    used = np.zeros(len(ref_cls), dtype=bool)
+    matched = 0
+    conf_diffs = []
+
+    # greedy by confidence, as the nms of the model itself
+    for idx in np.argsort(-conf):
+        candidates = np.flatnonzero((ref_cls == cls[idx]) & ~used)
+        if not len(candidates):
+            continue
+        ious = get_iou(xyxy[idx], ref_xyxy[candidates])
+        best = int(np.argmax(ious))
+        if ious[best] >= iou_threshold:
+            used[candidates[best]] = True
+            matched += 1
+            conf_diffs.append(abs(float(conf[idx] - ref_conf[candidates[best]])))
+    return matched, conf_diffs
+
+
+def run_backend(name: str, args, frames: list[np.ndarray]) -> tuple[dict, list]:
+    backend, int8 = parse_backend(name)
+    model = load_model(args.model, backend, args.imgsz, int8, args.export_dir)
+    batches = [frames[idx:idx + args.batch_size]
+               for idx in range(0, len(frames), args.batch_size)]
+
+    model.predict(batches[0], imgsz=args.imgsz, conf=args.conf, verbose=False)
+
+    detections = []
+    started_at = time.perf_counter()
+    for batch in batches:
+        results = model.predict(batch, imgsz=args.imgsz, conf=args.conf, verbose=False)
+        detections.extend(get_detections(res) for res in results)
+    wall = time.perf_counter() - started_at
+
+    return {
+        "backend": name,
+        "frames": len(frames),
+        "wall_s": wall,
+        "frames_per_s": len(frames) / wall if wall else 0.0,
+        "boxes": sum(len(cls) for cls, _, _ in detections),
+    }, detections
+
+
+def compare(reference: list, detections: list, iou_threshold: float) -> dict:
+    ref_total = sum(len(ref[0]) for ref in reference)
+    total = sum(len(det[0]) for det in detections)
+    matched = 0
+    conf_diffs = []
+    for ref, det in zip(reference, detections):
+        frame_matched, frame_conf_diffs = match_detections(ref, det, iou_threshold)
+        matched += frame_matched
+        conf_diffs.extend(frame_conf_diffs)
+
+    return {
+        "precision": matched / total if total else 1.0,
+        "recall": matched / ref_total if ref_total else 1.0,
+        "conf_diff": float(np.mean(conf_diffs)) if conf_diffs else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("frames", help="path to the folder of sample frames")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--export-dir", default="exported_models")
+    parser.add_argument("--backends", nargs="+",
+                        default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    frames = read_frames(args.frames)
+    if not frames:
+        parser.error(f"no frames found in: {args.frames}")
+
+    _, reference = run_backend("torch", args, frames)
+
+    print(f"{'backend':<14} {'frames':>7} {'wall, s':>8} {'frames/s':>9} "
+          f"{'boxes':>7} {'precision':>9} {'recall':>7} {'conf diff':>9}")
+    for name in args.backends:
+        try:
+            res, detections = run_backend(name, args, frames)
+        except ImportError as ex:
+            print(f"{name:<14} skipped: {ex}")
+            continue
+        acc = compare(reference, detections, args.iou)
+        print(f"{res['backend']:<14} {res['frames']:>7} {res['wall_s']:>8.2f} "
+              f"{res['frames_per_s']:>9.1f} {res['boxes']:>7} "
+              f"{acc['precision']:>9.3f} {acc['recall']:>7.3f} {acc['conf_diff']:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
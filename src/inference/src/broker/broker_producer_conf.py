@@ -9,6 +9,9 @@ class ProducerConfig(dict):
     def __init__(self):
         self.host = self._get_broker_host()
         self.port = self._get_broker_port()
+        self.linger_ms = self._get_linger_ms()
+        self.batch_size = self._get_batch_size()
+        self.compression_type = self._get_compression_type()
 
     def _get_broker_host(self):
         host = os.environ['KAFKA_BROKER_HOST']
@@ -18,9 +21,24 @@ class ProducerConfig(dict):
         port = os.environ['KAFKA_BROKER_PORT']
         return port
 
+    def _get_linger_ms(self):
+        linger_ms = int(os.environ.get('KAFKA_LINGER_MS', 5))
+        return linger_ms
+
+    def _get_batch_size(self):
+        batch_size = int(os.environ.get('KAFKA_BATCH_SIZE', 64 * 1024))
+        return batch_size
+
+    def _get_compression_type(self):
+        compression_type = os.environ.get('KAFKA_COMPRESSION_TYPE', "lz4")
+        return compression_type
+
     def get_config(self) -> dict[str:str]:
         config = {
-            "bootstrap.servers": f"{self.host}:{self.port}"
+            "bootstrap.servers": f"{self.host}:{self.port}",
+            "linger.ms": self.linger_ms,
+            "batch.size": self.batch_size,
+            "compression.type": self.compression_type,
         }
         return config
 
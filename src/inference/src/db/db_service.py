@@ -1,6 +1,6 @@
 import os
-import pickle
 import uuid
+from collections import Counter
 import pathlib
 import urllib3
 from io import BytesIO
@@ -11,20 +11,40 @@ from dotenv import load_dotenv, find_dotenv
 import redis
 from minio import Minio
 from minio import S3Error
+from minio.deleteobjects import DeleteObject
 
 from inference_models import Event
+from db.frame_container import FrameMeta, decode_frame
 from logger import log
 
 _env_file = find_dotenv(f'./.{os.getenv("ENV", "dev")}.env')
 load_dotenv(_env_file)
 
 
+def get_pred_counts_key(request_uuid: str) -> str:
+    return f"{request_uuid}:counts"
+
+
+def get_pred_recent_key(request_uuid: str) -> str:
+    return f"{request_uuid}:recent"
+
+
 class PredCacheDatabase():
+    """
+        predictions of a request are kept bounded: a hash of the counters
+        of every detected class and a stream of the last recent_window
+        frames, capped by MAXLEN
+
+        an entry of the stream is keyed by the frame id and keeps the
+        classes, the capture time and the packed detection records
+    """
+
     def __init__(self):
         self.host = self._get_host()
         self.port = self._get_port()
         self.__password = self._get_db_password()
         self.database = self._get_db()
+        self.recent_window = self._get_recent_window()
         self.conn = redis.Redis(
             host=self.host,
             port=self.port,
@@ -51,13 +71,34 @@ class PredCacheDatabase():
         db_partition = 0
         return db_partition
 
-    def save_pred(self, event: Event, predicitons: list[str]):
-        for pred in predicitons:
-            fine_pred = " " + str(pred)
-            self.conn.append(event.request_uuid, fine_pred)
+    def _get_recent_window(self):
+        recent_window = int(os.environ.get('INFERENCE_PRED_RECENT_WINDOW', 100))
+        return recent_window
+
+    def save_pred(self, event: Event, predicitons: list[str],
+                  detections: bytes = b"", captured_at: float = 0.0):
+        # one round trip per frame, whatever the number of boxes
+        pipe = self.conn.pipeline(transaction=False)
+        for pred, count in Counter(predicitons).items():
+            pipe.hincrby(get_pred_counts_key(event.request_uuid), pred, count)
+        pipe.xadd(
+            get_pred_recent_key(event.request_uuid),
+            {
+                "frame_id": event.stream_source,
+                "captured_at": captured_at,
+                "classes": " ".join(predicitons),
+                "detections": detections,
+            },
+            maxlen=self.recent_window,
+            approximate=True,
+        )
+        pipe.execute()
 
     def is_exists(self, event: Event):
-        return self.conn.keys(event.request_uuid)
+        return self.conn.exists(
+            get_pred_counts_key(event.request_uuid),
+            get_pred_recent_key(event.request_uuid),
+        )
 
     def clear_after_event(self, event: Event):
         cursor = '0'
@@ -113,26 +154,41 @@ class ImgS3Database():
         return password
 
     def get_frame_by_frame_id(self, frame_id: str) -> npt.ArrayLike:
+        frame, _ = self.get_frame_and_meta_by_frame_id(frame_id)
+        return frame
+
+    def get_frame_and_meta_by_frame_id(self, frame_id: str) -> tuple[npt.ArrayLike, FrameMeta]:
         bucket_name = IMAGE_BUCKET_NAME
         frm_obj_name = frame_id
         frame = None
+        meta = None
+        response = None
         try:
             response: urllib3.HTTPResponse = self.client.get_object(
                 bucket_name=bucket_name,
                 object_name=frm_obj_name
             )
 
-            raw_shape = response.headers["x-amz-meta-shape"]
-            shape = tuple(map(int, raw_shape.split(",")))
-
-            frame: npt.ArrayLike = pickle.loads(response.read()).reshape(shape)
+            frame, meta = decode_frame(response.read())
 
             log.info(
                 f"frame with frame_id: {frame_id} is retrived from storage")
         except S3Error:
             log.info(f"image not found in storage: {frame_id}")
+        except ValueError as ex:
+            log.info(f"invalid frame container: {frame_id} because of ex: {ex}")
         finally:
-            response.close()
-            response.release_conn()
+            if response is not None:
+                response.close()
+                response.release_conn()
 
-        return frame
+        return frame, meta
+
+    def delete_frames(self, frame_ids: list[str]) -> None:
+        errors = self.client.remove_objects(
+            IMAGE_BUCKET_NAME,
+            [DeleteObject(frame_id) for frame_id in frame_ids],
+        )
+        # deletion is lazy, it runs while the errors are iterated
+        for error in errors:
+            log.info(f"failed to delete frame: {error.name} because of error: {error}")
@@ -0,0 +1,121 @@
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+import numpy.typing as npt
+
+from db.frame_container import FrameMeta, decode_frame
+from logger import log
+
+SHM_FRAME_PREFIX = "shm://"
+SHM_DIR = "/dev/shm"
+RING_CHECK_INTERVAL_S = 5.0
+RING_MAGIC = b"FRNG"
+# magic, slots count, slot payload size
+RING_HEADER = struct.Struct("<4sIQ")
+RING_HEADER_SIZE = 64
+# sequence number, frame container size
+SLOT_HEADER = struct.Struct("<QQ")
+SLOT_HEADER_SIZE = 64
+
+
+def is_shm_frame_id(frame_id: str) -> bool:
+    return frame_id.startswith(SHM_FRAME_PREFIX)
+
+
+class SharedFrameRingReader():
+    """
+        reads frames from the runner shared memory rings on the same host
+
+        the frame is copied out of the shared slot and the slot sequence is
+        checked again after the copy: the frame waits in the prefetch and
+        batch queues, a view could be overwritten there when the runner
+        wraps around its ring, and so could a slot which is being copied
+
+        a ring unlinked by its runner stays mapped while it is attached,
+        so the unlinked rings are detached on the clean up of a stream
+        and every RING_CHECK_INTERVAL_S
+    """
+
+    def __init__(self):
+        self.rings: dict[str:shared_memory.SharedMemory] = {}
+        # prefetch threads read concurrently with the eviction
+        self.lock = threading.Lock()
+        self.checked_at = time.monotonic()
+
+    def __del__(self):
+        for shm in self.rings.values():
+            shm.close()
+
+    def evict_unlinked_rings(self) -> list[str]:
+        with self.lock:
+            return self.__evict_unlinked_rings()
+
+    def __evict_unlinked_rings(self) -> list[str]:
+        self.checked_at = time.monotonic()
+        evicted = [name for name in self.rings
+                   if not os.path.exists(os.path.join(SHM_DIR, name))]
+        for name in evicted:
+            self.rings.pop(name).close()
+        if evicted:
+            log.info(f"unlinked frame rings are detached: {evicted}")
+        return evicted
+
+    def __attach(self, name: str) -> shared_memory.SharedMemory:
+        shm = self.rings.get(name)
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=name)
+            # the ring is owned by the runner, the reader must not unlink it
+            resource_tracker.unregister(shm._name, "shared_memory")
+            self.rings[name] = shm
+        return shm
+
+    def get_frame_by_frame_id(self, frame_id: str) -> npt.ArrayLike:
+        frame, _ = self.get_frame_and_meta_by_frame_id(frame_id)
+        return frame
+
+    def get_frame_and_meta_by_frame_id(self, frame_id: str) -> tuple[npt.ArrayLike, FrameMeta]:
+        with self.lock:
+            if time.monotonic() - self.checked_at >= RING_CHECK_INTERVAL_S:
+                self.__evict_unlinked_rings()
+            return self.__read_frame(frame_id)
+
+    def __read_frame(self, frame_id: str) -> tuple[npt.ArrayLike, FrameMeta]:
+        try:
+            name, slot, seq = frame_id[len(SHM_FRAME_PREFIX):].rsplit("/", 2)
+            slot, seq = int(slot), int(seq)
+            shm = self.__attach(name)
+        except (ValueError, FileNotFoundError) as ex:
+            log.info(f"frame ring not found for frame_id: {frame_id} because of ex: {ex}")
+            return None, None
+
+        magic, slots, slot_size = RING_HEADER.unpack_from(shm.buf, 0)
+        if magic != RING_MAGIC or slot >= slots:
+            log.info(f"invalid frame ring reference: {frame_id}")
+            return None, None
+
+        offset = RING_HEADER_SIZE + slot * (SLOT_HEADER_SIZE + slot_size)
+        slot_seq, nbytes = SLOT_HEADER.unpack_from(shm.buf, offset)
+        if slot_seq != seq:
+            log.info(f"frame with frame_id: {frame_id} is overwritten in the ring")
+            return None, None
+
+        payload_offset = offset + SLOT_HEADER_SIZE
+        try:
+            view, meta = decode_frame(shm.buf[payload_offset:payload_offset + nbytes])
+            frame = np.array(view, copy=True)
+            del view
+        except ValueError as ex:
+            log.info(f"frame with frame_id: {frame_id} is overwritten while read: {ex}")
+            return None, None
+
+        slot_seq, _ = SLOT_HEADER.unpack_from(shm.buf, offset)
+        if slot_seq != seq:
+            log.info(f"frame with frame_id: {frame_id} is overwritten while read")
+            return None, None
+
+        log.info(f"frame with frame_id: {frame_id} is retrived from shared memory")
+        return frame, meta
@@ -0,0 +1,36 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+STALE_POLICIES = ("drop", "newest")
+
+
+class FreshnessConfig(object):
+    def __init__(self):
+        self.budget_s = self._get_budget_s()
+        self.stale_policy = self._get_stale_policy()
+
+    def _get_budget_s(self):
+        # 0 disables dropping of the stale frames, off by default
+        budget_s = float(os.environ.get('INFERENCE_FRESHNESS_BUDGET_S', 0))
+        return budget_s
+
+    def _get_stale_policy(self):
+        stale_policy = os.environ.get('INFERENCE_STALE_POLICY', "newest")
+        if stale_policy not in STALE_POLICIES:
+            raise ValueError(
+                f"Invalid stale policy: {stale_policy}, expected one of: {STALE_POLICIES}")
+        return stale_policy
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "budget_s": self.budget_s,
+            "stale_policy": self.stale_policy,
+        }
+        return config
+
+
+_config_manager = FreshnessConfig()
+freshness_config = _config_manager.get_config()
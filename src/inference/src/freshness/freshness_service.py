@@ -0,0 +1,68 @@
+import threading
+import time
+
+from freshness.freshness_conf import freshness_config
+from inference_models import Event
+
+
+class FreshnessFilter():
+    """
+        drops predict events of frames older than budget_s since capture
+
+        with the newest policy a stale frame is still kept when it is the
+        newest known frame of its request, so a camera which is behind
+        gets its latest result instead of none. frames without a capture
+        time, published by older runners, are never dropped
+    """
+
+    def __init__(self,
+                 budget_s: float = freshness_config["budget_s"],
+                 stale_policy: str = freshness_config["stale_policy"]):
+        self.budget_s = budget_s
+        self.stale_policy = stale_policy
+        self.newest_captured_at: dict[str:float] = {}
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.budget_s > 0
+
+    def observe(self, events: list[Event]) -> None:
+        with self._lock:
+            for event in events:
+                newest = self.newest_captured_at.get(event.request_uuid, 0.0)
+                if event.captured_at > newest:
+                    self.newest_captured_at[event.request_uuid] = event.captured_at
+
+    def is_stale(self, event: Event, now: float | None = None) -> bool:
+        if not self.is_enabled() or not event.captured_at:
+            return False
+
+        now = now or time.time()
+        if now - event.captured_at <= self.budget_s:
+            return False
+
+        if self.stale_policy == "newest":
+            with self._lock:
+                newest = self.newest_captured_at.get(event.request_uuid, 0.0)
+            return event.captured_at < newest
+        return True
+
+    def filter_events(self, events: list[Event]) -> tuple[list[Event], list[Event]]:
+        """splits the predict events into the kept and the dropped ones"""
+        if not self.is_enabled():
+            return events, []
+
+        self.observe(events)
+        now = time.time()
+        kept = []
+        dropped = []
+        for event in events:
+            if event.event == "predict" and self.is_stale(event, now):
+                dropped.append(event)
+            else:
+                kept.append(event)
+        return kept, dropped
+
+    def clear(self, request_uuid: str) -> None:
+        with self._lock:
+            self.newest_captured_at.pop(request_uuid, None)
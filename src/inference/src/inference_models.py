@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Any
 
 
 @dataclass
@@ -7,3 +8,20 @@ class Event:
     state: str
     request_uuid: str
     stream_source: str
+    captured_at: float = 0.0
+
+
+@dataclass
+class FrameTask:
+    event: Event
+    frame: Any
+    enqueued_at: float = 0.0
+    meta: Any = None
+    frame_hash: int | None = None
+
+
+@dataclass
+class AdaptiveLevel:
+    imgsz: int
+    model: str
+    skip: int = 1
@@ -1,34 +1,145 @@
-import threading
 import json
-
-from ultralytics import YOLO
-import numpy.typing as npt
+import threading
+import time
+from collections import OrderedDict, deque
 
 from broker.broker_service import Broker
-from inference_models import Event
+from inference_models import Event, FrameTask
 from db.db_service import PredCacheDatabase, ImgS3Database
+from db.shm_service import is_shm_frame_id
+from model.model_service import model_registry
+from predictor.predictor_conf import predictor_config
+from predictor.predictor_service import (
+    FramePredictor, set_torch_threads, init_worker_process, predict_events_in_worker
+)
+from batching.batching_service import BatchScheduler
+from adaptive.adaptive_service import AdaptiveController
+from freshness.freshness_service import FreshnessFilter
+from result_cache.result_cache_conf import result_cache_config
+from worker_runtime import WorkerRuntime
+from metrics import metrics
 from logger import log
 
 
 CONSUMER_TOPICS = ["runner_inference"]
+# short, the consumer loop must keep polling while the stages are full
+SUBMIT_TIMEOUT_S = 0.05
 
 
 class InferenceService():
 
     def __init__(self, topics=CONSUMER_TOPICS):
         self.msg_broker = Broker(topics=topics)
+        self.mode = predictor_config["mode"]
+        self.runtime = WorkerRuntime(
+            name="inference",
+            max_processes=predictor_config["workers"],
+            process_initializer=init_worker_process,
+            process_initargs=(predictor_config["torch_threads"],
+                              predictor_config["prefetch_workers"]),
+        )
+        # frames are downloaded ahead of the model by their own bounded
+        # stage, the batch scheduler thread is the compute stage
+        self.prefetch_runtime = WorkerRuntime(
+            name="inference_prefetch",
+            max_threads=predictor_config["prefetch_workers"],
+            max_queue=predictor_config["prefetch_queue"],
+        )
+
+        self.adaptive_controller = AdaptiveController()
+        self.freshness_filter = FreshnessFilter()
+        # shared by the runtime threads which delete the dropped frames
+        self.__img_db = ImgS3Database()
+        # requests cleaned up within the cache ttl, for the worker caches
+        self.ended_requests: OrderedDict[str, float] = OrderedDict()
+        self.ended_requests_lock = threading.Lock()
+        # consumed events which did not fit a full stage, in consume order
+        self.pending_events: deque[Event] = deque()
+
+        if self.mode == "process":
+            # models are loaded by the worker processes, the parent
+            # only exports them once and dispatches batches of frame ids
+            model_registry.export_all()
+            # the workers load and warm up the models before the first
+            # frames, not on the first batches
+            self.runtime.start_processes()
+            self.predictor = None
+            self.batch_scheduler = BatchScheduler(run_batch=self._dispatch_batch)
+        else:
+            set_torch_threads(predictor_config["torch_threads"])
+            model_registry.load_all()
+            self.predictor = FramePredictor()
+            self.batch_scheduler = BatchScheduler(run_batch=self._predict_batch)
+
+        log.info(
+            f"inference service is started in {self.mode} mode with settings: {predictor_config}")
+
+    def read_and_process_events(self):
+        metrics.report_if_due()
+        self.__process_pending_events()
+        self.__apply_backpressure()
+        self.adaptive_controller.update(self.__get_queue_depth())
 
-    def read_and_process_event(self):
-        event: Event = self.msg_broker.consume_event()
+        events: list[Event] = self.msg_broker.consume_events()
 
-        if not event:
+        if not events:
             return
 
-        log.debug(f"get event: {event.request_uuid}")
+        self.__publish_active_states(events)
 
-        self._process_event(event)
+        events, stale_events = self.freshness_filter.filter_events(events)
+        self.__drop_stale_events(stale_events)
 
-    def _process_event(self, event: Event) -> None:
+        for event in events:
+            log.debug(f"get event: {event.request_uuid}")
+
+            if event.event == "predict" and not self.adaptive_controller.should_process(event):
+                metrics.inc("inference_frames_skipped")
+                self.__delete_event_frames([event], "skipped")
+                continue
+            self.pending_events.append(event)
+
+        self.__process_pending_events()
+
+    def __process_pending_events(self) -> None:
+        # stops at the first event which does not fit, so the events
+        # are still processed in the consume order
+        while self.pending_events:
+            if not self._process_event(self.pending_events[0]):
+                metrics.set_gauge("inference_pending_events", len(self.pending_events))
+                return
+            self.pending_events.popleft()
+        metrics.set_gauge("inference_pending_events", 0)
+
+    def __apply_backpressure(self):
+        # the consumer is paused but keeps polling while the stages are
+        # full, so it stays in the group within max.poll.interval.ms
+        if (self.pending_events
+                or self.runtime.is_saturated()
+                or self.prefetch_runtime.is_saturated()):
+            self.msg_broker.pause()
+        else:
+            self.msg_broker.resume()
+
+    def __get_queue_depth(self) -> int:
+        # frames and batches waiting in the stages of the service
+        return (len(self.pending_events)
+                + self.prefetch_runtime.pending()
+                + self.batch_scheduler.qsize()
+                + self.runtime.pending())
+
+    def __publish_active_states(self, events: list[Event]) -> None:
+        # one state update per request for the whole batch of frames
+        published = set()
+        for event in events:
+            if event.event != "predict" or event.request_uuid in published:
+                continue
+            self.msg_broker.publish_event(
+                event=event, topic="inference_fsm_st", state="active")
+            published.add(event.request_uuid)
+
+    def _process_event(self, event: Event) -> bool:
+        """returns false when the event does not fit a full stage yet"""
         log.info(
             f"start to process event: {event.event} with uuid:{event.request_uuid}")
 
@@ -36,64 +147,131 @@ class InferenceService():
 
         match event_type:
             case "predict":
-                self.msg_broker.publish_event(
-                    event=event, topic="inference_fsm_st", state="active")
-
-                event_th = threading.Thread(
-                    target=self._predict,
-                    args=((event,)),
-                    daemon=True
-                )
-                event_th.start()
+                if self.mode == "process":
+                    # the frame is fetched by the worker, the batch takes
+                    # the runtime slot when it is dispatched
+                    is_submitted = self.batch_scheduler.submit(
+                        FrameTask(event=event, frame=None), timeout=SUBMIT_TIMEOUT_S)
+                else:
+                    is_submitted = self.prefetch_runtime.submit(
+                        self._prefetch, event, time.monotonic(),
+                        timeout=SUBMIT_TIMEOUT_S) is not None
+                if not is_submitted:
+                    return False
 
                 log.debug(
                     f"start processing for event {event_type} with: {event.request_uuid}")
 
             case "clean_up":
-                event_th = threading.Thread(
-                    target=self.__clear_cache_db,
-                    args=((event,)),
-                    daemon=True
-                )
-                event_th.start()
+                if self.runtime.submit(self.__clear_cache_db, event,
+                                       timeout=SUBMIT_TIMEOUT_S) is None:
+                    return False
 
                 log.debug(
                     f"start processing for event {event_type} with: {event.request_uuid}")
 
             case _:
                 log.warning(f"not implemented event_type: {event_type}")
+        return True
 
-    def _predict(self, event: Event):
-        model = YOLO("yolov8n.pt")
-        frame = self.__get_frame(event)
+    def _prefetch(self, event: Event, submitted_at: float):
+        metrics.observe("inference_prefetch_queue_wait_seconds",
+                        time.monotonic() - submitted_at)
+        if self.freshness_filter.is_stale(event):
+            self.__drop_stale_events([event])
+            return
+
+        task = self.predictor.get_frame(event)
+
+        if task is None:
+            return
 
-        if frame is None:
+        self.batch_scheduler.submit(task)
+
+    def _predict_batch(self, tasks: list[FrameTask]):
+        tasks = self.__filter_stale_tasks(tasks)
+        if not tasks:
             return
 
-        results = model.predict(source=frame, save=False, verbose=False)
+        frame_ages = self.predictor.predict_batch(tasks, self.adaptive_controller.level)
+        self.adaptive_controller.observe_frame_ages(frame_ages)
 
-        predicted_classes = [""]
+    def _dispatch_batch(self, tasks: list[FrameTask]):
+        tasks = self.__filter_stale_tasks(tasks)
+        if not tasks:
+            return
 
-        for res in results:
-            for box in res.boxes:
-                idx = int(box.cls.item())
-                class_name = res.names[idx]
-                predicted_classes.append(class_name)
+        future = self.runtime.submit_process(
+            predict_events_in_worker, [task.event for task in tasks],
+            self.adaptive_controller.level, self.__get_ended_requests())
+        future.add_done_callback(self.__observe_worker_frame_ages)
 
-        self.__save_pred(event, predicted_classes)
+    def __get_ended_requests(self) -> tuple[str, ...]:
+        # the cached entries are not reused after the ttl anyway
+        # and a worker evicts such requests itself
+        now = time.monotonic()
+        with self.ended_requests_lock:
+            while self.ended_requests:
+                request_uuid, ended_at = next(iter(self.ended_requests.items()))
+                if now - ended_at <= result_cache_config["ttl_s"]:
+                    break
+                self.ended_requests.popitem(last=False)
+            return tuple(self.ended_requests)
 
-    def __save_pred(self, event: Event, predicted_classes: list["str"]):
-        log.debug(f"before save preds: {predicted_classes}")
-        cache_db = PredCacheDatabase()
-        cache_db.save_pred(event, predicted_classes)
+    def __observe_worker_frame_ages(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.adaptive_controller.observe_frame_ages(future.result())
+
+    def __filter_stale_tasks(self, tasks: list[FrameTask]) -> list[FrameTask]:
+        # frames also age in the queues of the service, not only in kafka
+        kept = []
+        stale_events = []
+        now = time.time()
+        for task in tasks:
+            if self.freshness_filter.is_stale(task.event, now):
+                stale_events.append(task.event)
+            else:
+                kept.append(task)
+
+        self.__drop_stale_events(stale_events)
+        return kept
+
+    def __drop_stale_events(self, events: list[Event]) -> None:
+        if not events:
+            return
+
+        metrics.inc("inference_frames_dropped_stale", len(events))
+        log.debug(f"drop {len(events)} stale frames")
+        self.__delete_event_frames(events, "stale")
+
+    def __delete_event_frames(self, events: list[Event], reason: str) -> None:
+        # frames of the shared memory rings are overwritten by the runner
+        frame_ids = [event.stream_source for event in events
+                     if not is_shm_frame_id(event.stream_source)]
+        if not frame_ids:
+            return
+        # best effort, the frames left are removed by the clean up of
+        # the stream, a full runtime must not block the consumer loop
+        if self.runtime.submit(self.__delete_frames, frame_ids, reason,
+                               timeout=SUBMIT_TIMEOUT_S) is None:
+            metrics.inc("inference_frames_delete_skipped", len(frame_ids))
 
-    def __get_frame(self, event: Event) -> npt.ArrayLike:
-        _img_db = ImgS3Database()
-        frame = _img_db.get_frame_by_frame_id(event.stream_source)
-        return frame
+    def __delete_frames(self, frame_ids: list[str], reason: str) -> None:
+        self.__img_db.delete_frames(frame_ids)
+        metrics.inc(f"inference_frames_deleted_{reason}", len(frame_ids))
 
     def __clear_cache_db(self, event: Event):
         log.debug(f"before processes db clean for event:{event.request_uuid}")
+        if self.predictor is not None:
+            self.predictor.result_cache.clear(event.request_uuid)
+            self.predictor.frame_ring_reader.evict_unlinked_rings()
+        elif result_cache_config["hash_distance"] >= 0:
+            with self.ended_requests_lock:
+                self.ended_requests[event.request_uuid] = time.monotonic()
+                self.ended_requests.move_to_end(event.request_uuid)
+        self.adaptive_controller.clear(event.request_uuid)
+        self.freshness_filter.clear(event.request_uuid)
         cache_db = PredCacheDatabase()
         cache_db.clear_after_event(event)
 
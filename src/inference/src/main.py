@@ -1,5 +1,4 @@
 from logger import log
-from inference_service import inference_service
 
 import time
 
@@ -8,6 +7,9 @@ RESTART_DELAY = 2
 
 
 def main():
+    # imported here and not at the top, spawned worker processes
+    # import this module and must not create the service
+    from inference_service import inference_service
 
     log.info("inference server is starting...")
 
@@ -19,7 +21,7 @@ def main():
             )
             break
         try:
-            inference_service.read_and_process_event()
+            inference_service.read_and_process_events()
         except Exception as ex:
             log.warning(
                 f"inference server is stopped because of exception: {ex}"
@@ -0,0 +1,106 @@
+import os
+import bisect
+import threading
+import time
+from dotenv import load_dotenv, find_dotenv
+
+from logger import log
+
+_env_file = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(_env_file)
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class Histogram():
+    def __init__(self, buckets: tuple[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[min(idx, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def summary(self) -> dict[str:float]:
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class MetricsRegistry():
+    """
+        in process counters, gauges and histograms
+
+        the snapshot is written to the service log every report interval,
+        values are per process, so every worker process reports its own
+    """
+
+    def __init__(self):
+        self.report_interval = self._get_report_interval()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def _get_report_interval(self):
+        interval = float(os.environ.get('METRICS_REPORT_INTERVAL', 30))
+        return interval
+
+    def reset(self):
+        with self._lock:
+            self.counters: dict[str:float] = {}
+            self.gauges: dict[str:float] = {}
+            self.histograms: dict[str:Histogram] = {}
+            self.last_report_at = time.monotonic()
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: tuple[float] = DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets)
+            self.histograms[name].observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {
+                    name: hist.summary() for name, hist in self.histograms.items()
+                },
+            }
+
+    def report_if_due(self):
+        now = time.monotonic()
+        if now - self.last_report_at < self.report_interval:
+            return
+        self.last_report_at = now
+        log.info(f"metrics: {self.snapshot()}")
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,87 @@
+import pathlib
+import shutil
+
+from ultralytics import YOLO
+
+from model.model_conf import MODEL_BACKENDS
+from logger import log
+
+
+def get_exported_path(name: str, backend: str, imgsz: int,
+                      int8: bool, export_dir: str) -> pathlib.Path:
+    stem = pathlib.Path(name).stem
+    suffix = f"-{imgsz}-int8" if int8 else f"-{imgsz}"
+
+    match backend:
+        case "onnx":
+            return pathlib.Path(export_dir, f"{stem}{suffix}.onnx")
+        case "openvino":
+            # ultralytics finds the backend of a dir by this ending
+            return pathlib.Path(export_dir, f"{stem}{suffix}_openvino_model")
+        case _:
+            raise ValueError(
+                f"Invalid model backend: {backend}, expected one of: {MODEL_BACKENDS}")
+
+
+def export_model(name: str, backend: str, imgsz: int, int8: bool = False,
+                 export_dir: str = "exported_models", int8_data: str | None = None) -> str:
+    """
+        export the torch weights to the backend once and return the path
+        to load the model from, the next calls reuse the exported files
+
+        onnx is exported with dynamic axes, so the batches of any size
+        can be run, int8 of onnx is the dynamic weight quantization of
+        onnxruntime, int8 of openvino is the calibrated one of nncf
+    """
+    if backend == "torch":
+        return name
+
+    path = get_exported_path(name, backend, imgsz, int8, export_dir)
+    if path.exists():
+        return str(path)
+
+    pathlib.Path(export_dir).mkdir(parents=True, exist_ok=True)
+    log.info(f"exporting model: {name} to {backend}, int8: {int8}")
+
+    match backend:
+        case "onnx":
+            fp32_path = get_exported_path(name, backend, imgsz, False, export_dir)
+            if not fp32_path.exists():
+                exported = YOLO(name).export(
+                    format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+                shutil.move(exported, fp32_path)
+            if int8:
+                quantize_onnx(str(fp32_path), str(path))
+
+        case "openvino":
+            export_kwargs = {"data": int8_data} if int8 and int8_data else {}
+            exported = YOLO(name).export(
+                format="openvino", imgsz=imgsz, dynamic=True, int8=int8, **export_kwargs)
+            shutil.move(exported, path)
+
+        case _:
+            raise ValueError(
+                f"Invalid model backend: {backend}, expected one of: {MODEL_BACKENDS}")
+
+    log.info(f"model: {name} is exported to {path}")
+    return str(path)
+
+
+def quantize_onnx(model_path: str, quantized_path: str) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        model_input=model_path,
+        model_output=quantized_path,
+        weight_type=QuantType.QUInt8,
+    )
+
+
+def load_model(name: str, backend: str, imgsz: int, int8: bool = False,
+               export_dir: str = "exported_models", int8_data: str | None = None) -> YOLO:
+    path = export_model(name, backend, imgsz, int8, export_dir, int8_data)
+    if backend == "torch":
+        return YOLO(path)
+    # names and the task are read from the metadata of the export,
+    # results have the same boxes and names as of the torch model
+    return YOLO(path, task="detect")
@@ -0,0 +1,86 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+MODEL_BACKENDS = ("torch", "onnx", "openvino")
+
+
+class ModelConfig(object):
+    def __init__(self):
+        self.models = self._get_models()
+        self.default_model = self._get_default_model()
+        self.imgsz = self._get_imgsz()
+        self.backend = self._get_backend()
+        self.int8 = self._get_int8()
+        self.int8_data = self._get_int8_data()
+        self.export_dir = self._get_export_dir()
+        self.conf = self._get_conf()
+        self.classes = self._get_classes()
+
+    def _get_models(self):
+        models = os.environ.get('INFERENCE_MODELS', "yolov8n.pt")
+        return [model.strip() for model in models.split(",") if model.strip()]
+
+    def _get_default_model(self):
+        default_model = os.environ.get('INFERENCE_DEFAULT_MODEL', self.models[0])
+        if default_model not in self.models:
+            raise ValueError(
+                f"Invalid default model: {default_model}, expected one of: {self.models}")
+        return default_model
+
+    def _get_imgsz(self):
+        imgsz = int(os.environ.get('INFERENCE_IMGSZ', 640))
+        return imgsz
+
+    def _get_backend(self):
+        backend = os.environ.get('INFERENCE_BACKEND', "torch")
+        if backend not in MODEL_BACKENDS:
+            raise ValueError(
+                f"Invalid model backend: {backend}, expected one of: {MODEL_BACKENDS}")
+        return backend
+
+    def _get_int8(self):
+        int8 = os.environ.get('INFERENCE_INT8', "false").lower() in ("1", "true", "yes")
+        if int8 and self.backend == "torch":
+            raise ValueError("INFERENCE_INT8 requires onnx or openvino backend")
+        return int8
+
+    def _get_int8_data(self):
+        # calibration dataset of openvino int8, ultralytics default if unset
+        int8_data = os.environ.get('INFERENCE_INT8_DATA') or None
+        return int8_data
+
+    def _get_export_dir(self):
+        export_dir = os.environ.get('INFERENCE_EXPORT_DIR', "exported_models")
+        return export_dir
+
+    def _get_conf(self):
+        conf = float(os.environ.get('INFERENCE_CONF', 0.25))
+        if not 0 <= conf <= 1:
+            raise ValueError(f"Invalid confidence threshold: {conf}, must be in [0, 1]")
+        return conf
+
+    def _get_classes(self):
+        # class names or ids, empty means all the classes of the model
+        classes = os.environ.get('INFERENCE_CLASSES', "")
+        return [name.strip() for name in classes.split(",") if name.strip()]
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "models": self.models,
+            "default_model": self.default_model,
+            "imgsz": self.imgsz,
+            "backend": self.backend,
+            "int8": self.int8,
+            "int8_data": self.int8_data,
+            "export_dir": self.export_dir,
+            "conf": self.conf,
+            "classes": self.classes,
+        }
+        return config
+
+
+_config_manager = ModelConfig()
+model_config = _config_manager.get_config()
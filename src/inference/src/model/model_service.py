@@ -0,0 +1,115 @@
+import threading
+import time
+
+import numpy as np
+from ultralytics import YOLO
+
+from model.model_conf import model_config
+from model.backend_service import export_model, load_model
+from metrics import metrics
+from logger import log
+
+
+class LoadedModel():
+    """
+        model instance shared by the workers of the process, the predictor
+        of ultralytics keeps state between the calls, so they are serialized
+    """
+
+    def __init__(self, name: str, model: YOLO):
+        self.name = name
+        self.model = model
+        self.lock = threading.Lock()
+        self.predict_kwargs = {}
+
+    @property
+    def names(self) -> dict[int:str]:
+        return self.model.names
+
+    def predict(self, source, **kwargs):
+        kwargs = {**self.predict_kwargs, **kwargs}
+        with self.lock:
+            return self.model.predict(source=source, save=False, verbose=False, **kwargs)
+
+
+class ModelRegistry():
+    def __init__(self,
+                 models: list[str] = model_config["models"],
+                 default_model: str = model_config["default_model"],
+                 imgsz: int = model_config["imgsz"],
+                 backend: str = model_config["backend"],
+                 int8: bool = model_config["int8"],
+                 int8_data: str | None = model_config["int8_data"],
+                 export_dir: str = model_config["export_dir"],
+                 conf: float = model_config["conf"],
+                 classes: list[str] = model_config["classes"]):
+        self.model_names = models
+        self.default_model = default_model
+        self.imgsz = imgsz
+        self.backend = backend
+        self.int8 = int8
+        self.int8_data = int8_data
+        self.export_dir = export_dir
+        self.conf = conf
+        self.classes = classes
+        self.models: dict[str:LoadedModel] = {}
+        self._lock = threading.Lock()
+
+    def load_all(self) -> None:
+        for name in self.model_names:
+            self.get(name)
+
+    def export_all(self) -> None:
+        """export the models without loading them, before workers are started"""
+        for name in self.model_names:
+            export_model(name, self.backend, self.imgsz,
+                         self.int8, self.export_dir, self.int8_data)
+
+    def get(self, name: str | None = None) -> LoadedModel:
+        name = name or self.default_model
+        loaded = self.models.get(name)
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            if name not in self.models:
+                self.models[name] = self.__load(name)
+        return self.models[name]
+
+    def __load(self, name: str) -> LoadedModel:
+        started_at = time.perf_counter()
+        loaded = LoadedModel(name, load_model(
+            name, self.backend, self.imgsz, self.int8, self.export_dir, self.int8_data))
+        load_seconds = time.perf_counter() - started_at
+        # the threshold and the classes filter are applied by the nms of
+        # the model, the filtered boxes never reach the post-processing
+        loaded.predict_kwargs = {
+            "conf": self.conf,
+            "classes": self.__get_class_ids(loaded),
+        }
+
+        # the first predict builds the predictor and fuses the layers,
+        # it is done here instead of on the first frame of a stream
+        started_at = time.perf_counter()
+        loaded.predict(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz)
+        warmup_seconds = time.perf_counter() - started_at
+
+        metrics.set_gauge(f"inference_model_{name}_load_seconds", load_seconds)
+        metrics.set_gauge(f"inference_model_{name}_warmup_seconds", warmup_seconds)
+        log.info(
+            f"model: {name} with backend: {self.backend}, int8: {self.int8} is loaded in {load_seconds:.2f}s and warmed up in {warmup_seconds:.2f}s")
+        return loaded
+
+    def __get_class_ids(self, loaded: LoadedModel) -> list[int] | None:
+        if not self.classes:
+            return None
+
+        class_ids = [idx for idx, class_name in loaded.names.items()
+                     if class_name in self.classes or str(idx) in self.classes]
+        if not class_ids:
+            raise ValueError(
+                f"Invalid classes: {self.classes}, none of them is known by model: {loaded.name}")
+        return class_ids
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,51 @@
+"""
+    compact binary encoding of the detections of one frame
+
+    every box is a packed record of 22 bytes: class id (u2), confidence
+    and xyxy box (f4) in the coords of the source frame, so the roi crop,
+    the downscale and the letterbox of the runner are already undone
+"""
+import numpy as np
+import numpy.typing as npt
+
+from db.frame_container import FrameTransform
+
+DETECTION_RECORD = np.dtype([
+    ("cls", "<u2"),
+    ("conf", "<f4"),
+    ("x1", "<f4"),
+    ("y1", "<f4"),
+    ("x2", "<f4"),
+    ("y2", "<f4"),
+])
+
+
+def extract_detections(res, transform: FrameTransform | None = None) -> npt.NDArray:
+    """boxes of an ultralytics result to records, without a python loop per box"""
+    boxes = res.boxes
+    cls = boxes.cls.cpu().numpy()
+    conf = boxes.conf.cpu().numpy()
+    xyxy = boxes.xyxy.cpu().numpy()
+    if transform is not None and len(xyxy):
+        xyxy = transform.to_source_boxes(xyxy)
+
+    records = np.empty(len(cls), dtype=DETECTION_RECORD)
+    records["cls"] = cls
+    records["conf"] = conf
+    records["x1"] = xyxy[:, 0]
+    records["y1"] = xyxy[:, 1]
+    records["x2"] = xyxy[:, 2]
+    records["y2"] = xyxy[:, 3]
+    return records
+
+
+def get_detected_classes(records: npt.NDArray, names: dict[int:str]) -> list[str]:
+    return [names[idx] for idx in records["cls"].tolist()]
+
+
+def encode_detections(records: npt.NDArray) -> bytes:
+    return records.astype(DETECTION_RECORD, copy=False).tobytes()
+
+
+def decode_detections(buff: bytes) -> npt.NDArray:
+    return np.frombuffer(buff, dtype=DETECTION_RECORD)
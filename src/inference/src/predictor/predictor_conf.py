@@ -0,0 +1,63 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+PREDICTOR_MODES = ("thread", "process")
+
+
+class PredictorConfig(object):
+    def __init__(self):
+        self.mode = self._get_mode()
+        self.torch_threads = self._get_torch_threads()
+        self.workers = self._get_workers()
+        self.prefetch_workers = self._get_prefetch_workers()
+        self.prefetch_queue = self._get_prefetch_queue()
+
+    def _get_mode(self):
+        mode = os.environ.get('INFERENCE_MODE', "thread")
+        if mode not in PREDICTOR_MODES:
+            raise ValueError(
+                f"Invalid inference mode: {mode}, expected one of: {PREDICTOR_MODES}")
+        return mode
+
+    def _get_torch_threads(self):
+        # 0 keeps the torch default, one intra-op thread per core,
+        # worker processes are pinned to one thread unless set
+        default = 1 if self.mode == "process" else 0
+        torch_threads = int(os.environ.get('INFERENCE_TORCH_THREADS', default))
+        return torch_threads
+
+    def _get_workers(self):
+        default = max((os.cpu_count() or 1) // max(self.torch_threads, 1), 1)
+        workers = int(os.environ.get('INFERENCE_WORKERS', default))
+        if workers < 1:
+            raise ValueError(
+                f"Invalid inference workers: {workers}, must be >= 1")
+        return workers
+
+    def _get_prefetch_workers(self):
+        prefetch_workers = int(os.environ.get('INFERENCE_PREFETCH_WORKERS', 4))
+        if prefetch_workers < 1:
+            raise ValueError(
+                f"Invalid prefetch workers: {prefetch_workers}, must be >= 1")
+        return prefetch_workers
+
+    def _get_prefetch_queue(self):
+        prefetch_queue = int(os.environ.get('INFERENCE_PREFETCH_QUEUE', 64))
+        return prefetch_queue
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "mode": self.mode,
+            "torch_threads": self.torch_threads,
+            "workers": self.workers,
+            "prefetch_workers": self.prefetch_workers,
+            "prefetch_queue": self.prefetch_queue,
+        }
+        return config
+
+
+_config_manager = PredictorConfig()
+predictor_config = _config_manager.get_config()
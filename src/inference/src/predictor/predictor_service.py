@@ -0,0 +1,176 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy.typing as npt
+
+from inference_models import AdaptiveLevel, Event, FrameTask
+from db.db_service import PredCacheDatabase, ImgS3Database
+from db.shm_service import SharedFrameRingReader, is_shm_frame_id
+from model.model_service import model_registry
+from predictor.detections import (
+    encode_detections, extract_detections, get_detected_classes
+)
+from result_cache.result_cache_service import CachedResult, ResultCache, get_dhash
+from metrics import metrics
+from logger import log
+
+
+class FramePredictor():
+    """
+        fetches frames of the events, runs the model on them in one batch
+        and saves the detections
+
+        used by the service itself in thread mode and by every worker
+        process in process mode, it must not import the service module,
+        it creates the kafka consumer on import
+
+        every stage observes its own latency: inference_fetch_seconds,
+        inference_compute_seconds and inference_save_seconds
+    """
+
+    def __init__(self, fetch_workers: int = 1):
+        self.frame_ring_reader = SharedFrameRingReader()
+        self.__img_db = None
+        self.__img_db_lock = threading.Lock()
+        self.result_cache = ResultCache()
+        self.fetch_pool = None
+        if fetch_workers > 1:
+            self.fetch_pool = ThreadPoolExecutor(
+                max_workers=fetch_workers, thread_name_prefix="fetch")
+
+    def get_frame(self, event: Event) -> FrameTask | None:
+        started_at = time.perf_counter()
+        if is_shm_frame_id(event.stream_source):
+            frame, meta = self.frame_ring_reader.get_frame_and_meta_by_frame_id(
+                event.stream_source)
+        else:
+            frame, meta = self.__get_img_db().get_frame_and_meta_by_frame_id(
+                event.stream_source)
+
+        metrics.observe("inference_fetch_seconds", time.perf_counter() - started_at)
+        if frame is None:
+            metrics.inc("inference_frames_missed")
+            return None
+        return FrameTask(event=event, frame=frame, meta=meta)
+
+    def predict_events(self, events: list[Event],
+                       level: AdaptiveLevel | None = None) -> list[float]:
+        # frames of the batch are downloaded concurrently
+        if self.fetch_pool is not None:
+            tasks = self.fetch_pool.map(self.get_frame, events)
+        else:
+            tasks = map(self.get_frame, events)
+
+        tasks = [task for task in tasks if task is not None]
+
+        if not tasks:
+            return []
+        return self.predict_batch(tasks, level)
+
+    def predict_batch(self, tasks: list[FrameTask],
+                      level: AdaptiveLevel | None = None) -> list[float]:
+        """returns the ages of the frames since their capture"""
+        pending = tasks
+        if self.result_cache.is_enabled():
+            pending = self.__reuse_cached_results(tasks)
+
+        if pending:
+            self.__run_model(pending, level)
+
+        now = time.time()
+        frame_ages = [now - task.meta.captured_at for task in tasks
+                      if task.meta is not None and task.meta.captured_at]
+        for frame_age in frame_ages:
+            metrics.observe("inference_frame_age_seconds", frame_age)
+        return frame_ages
+
+    def __run_model(self, tasks: list[FrameTask], level: AdaptiveLevel | None):
+        model = model_registry.get(level.model if level else None)
+        imgsz = level.imgsz if level else model_registry.imgsz
+        started_at = time.perf_counter()
+        results = model.predict([task.frame for task in tasks], imgsz=imgsz)
+        metrics.observe("inference_compute_seconds", time.perf_counter() - started_at)
+
+        started_at = time.perf_counter()
+        for task, res in zip(tasks, results):
+            meta = task.meta
+            detections = extract_detections(res, meta.transform if meta else None)
+            predicted_classes = get_detected_classes(detections, res.names)
+            if task.frame_hash is not None:
+                self.result_cache.put(
+                    task.event.request_uuid, task.frame_hash,
+                    CachedResult(detections, predicted_classes, time.monotonic()))
+
+            self.__save_pred(task.event, predicted_classes, detections,
+                             meta.captured_at if meta else 0.0)
+        metrics.observe("inference_save_seconds", time.perf_counter() - started_at)
+
+    def __reuse_cached_results(self, tasks: list[FrameTask]) -> list[FrameTask]:
+        """saves the cached detections of the hits, returns the misses"""
+        misses = []
+        for task in tasks:
+            task.frame_hash = get_dhash(task.frame)
+            cached = self.result_cache.get(task.event.request_uuid, task.frame_hash)
+            if cached is None:
+                misses.append(task)
+                continue
+
+            meta = task.meta
+            self.__save_pred(task.event, cached.classes, cached.detections,
+                             meta.captured_at if meta else 0.0)
+        return misses
+
+    def __save_pred(self, event: Event, predicted_classes: list["str"],
+                    detections: npt.NDArray, captured_at: float):
+        log.debug(f"before save preds: {predicted_classes}")
+        cache_db = PredCacheDatabase()
+        cache_db.save_pred(event, predicted_classes,
+                           encode_detections(detections), captured_at)
+
+    def __get_img_db(self) -> ImgS3Database:
+        # the frames are fetched by the prefetch or the fetch threads
+        with self.__img_db_lock:
+            if self.__img_db is None:
+                self.__img_db = ImgS3Database()
+            return self.__img_db
+
+
+def set_torch_threads(torch_threads: int) -> None:
+    if torch_threads <= 0:
+        return
+
+    import torch
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # can be set only once, before the first parallel work
+        pass
+
+
+_worker_predictor: FramePredictor | None = None
+
+
+def init_worker_process(torch_threads: int, fetch_workers: int = 1) -> None:
+    """initializer of the spawned inference worker processes"""
+    global _worker_predictor
+
+    set_torch_threads(torch_threads)
+    model_registry.load_all()
+    _worker_predictor = FramePredictor(fetch_workers=fetch_workers)
+    log.info(f"inference worker is started with {torch_threads} torch threads")
+
+
+def predict_events_in_worker(events: list[Event],
+                             level: AdaptiveLevel | None = None,
+                             ended_requests: tuple[str, ...] = ()) -> list[float]:
+    # the clean up is seen only by the parent, it sends the recently
+    # ended requests with every batch to whichever worker takes it
+    for request_uuid in ended_requests:
+        _worker_predictor.result_cache.clear(request_uuid)
+
+    frame_ages = _worker_predictor.predict_events(events, level)
+    metrics.inc("inference_worker_frames_predicted", len(frame_ages))
+    metrics.report_if_due()
+    return frame_ages
@@ -0,0 +1,52 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+
+class ResultCacheConfig(object):
+    def __init__(self):
+        self.hash_distance = self._get_hash_distance()
+        self.max_entries = self._get_max_entries()
+        self.max_requests = self._get_max_requests()
+        self.ttl_s = self._get_ttl_s()
+
+    def _get_hash_distance(self):
+        # -1 disables the cache, 0 reuses only the exact same hash.
+        # off by default, the reused detections are of an older frame
+        hash_distance = int(os.environ.get('INFERENCE_CACHE_HASH_DISTANCE', -1))
+        return hash_distance
+
+    def _get_max_entries(self):
+        max_entries = int(os.environ.get('INFERENCE_CACHE_MAX_ENTRIES', 16))
+        if max_entries < 1:
+            raise ValueError(
+                f"Invalid cache max entries: {max_entries}, must be >= 1")
+        return max_entries
+
+    def _get_max_requests(self):
+        max_requests = int(os.environ.get('INFERENCE_CACHE_MAX_REQUESTS', 1024))
+        if max_requests < 1:
+            raise ValueError(
+                f"Invalid cache max requests: {max_requests}, must be >= 1")
+        return max_requests
+
+    def _get_ttl_s(self):
+        # well below the max skip of the runner gate, so the frame which
+        # the gate forces through to refresh the detections is inferred
+        ttl_s = float(os.environ.get('INFERENCE_CACHE_TTL_S', 2))
+        return ttl_s
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "hash_distance": self.hash_distance,
+            "max_entries": self.max_entries,
+            "max_requests": self.max_requests,
+            "ttl_s": self.ttl_s,
+        }
+        return config
+
+
+_config_manager = ResultCacheConfig()
+result_cache_config = _config_manager.get_config()
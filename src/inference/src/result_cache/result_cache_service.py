@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from result_cache.result_cache_conf import result_cache_config
+from metrics import metrics
+
+DHASH_SIZE = 8
+
+
+def get_dhash(frame: npt.ArrayLike) -> int:
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, (DHASH_SIZE + 1, DHASH_SIZE),
+                       interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+@dataclass
+class CachedResult:
+    detections: npt.NDArray
+    classes: list[str]
+    cached_at: float
+
+
+class ResultCache():
+    """
+        detections of the recent frames of every request, keyed by the
+        dhash of the frame, a frame within hash_distance bits of a cached
+        one reuses its detections instead of the model call
+
+        both the entries of a request and the requests are evicted in
+        lru order, entries older than ttl_s are not reused and a request
+        with only such entries is evicted, so the requests which have
+        ended expire even where their clean up is not seen
+    """
+
+    def __init__(self,
+                 hash_distance: int = result_cache_config["hash_distance"],
+                 max_entries: int = result_cache_config["max_entries"],
+                 max_requests: int = result_cache_config["max_requests"],
+                 ttl_s: float = result_cache_config["ttl_s"]):
+        self.hash_distance = hash_distance
+        self.max_entries = max_entries
+        self.max_requests = max_requests
+        self.ttl_s = ttl_s
+        self.requests: OrderedDict[str, OrderedDict[int, CachedResult]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.hash_distance >= 0
+
+    def get(self, request_uuid: str, frame_hash: int) -> CachedResult | None:
+        now = time.monotonic()
+        with self._lock:
+            entries = self.requests.get(request_uuid)
+            found = None
+            if entries is not None:
+                self.requests.move_to_end(request_uuid)
+                found = self.__find(entries, frame_hash, now)
+
+            if found is None:
+                self.misses += 1
+                metrics.inc("inference_cache_misses")
+            else:
+                self.hits += 1
+                metrics.inc("inference_cache_hits")
+            metrics.set_gauge("inference_cache_hit_rate",
+                              self.hits / (self.hits + self.misses))
+            return found
+
+    def put(self, request_uuid: str, frame_hash: int, result: CachedResult) -> None:
+        with self._lock:
+            self.__evict_expired(result.cached_at)
+            entries = self.requests.get(request_uuid)
+            if entries is None:
+                entries = self.requests[request_uuid] = OrderedDict()
+                if len(self.requests) > self.max_requests:
+                    self.requests.popitem(last=False)
+            self.requests.move_to_end(request_uuid)
+
+            entries[frame_hash] = result
+            entries.move_to_end(frame_hash)
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self, request_uuid: str) -> None:
+        with self._lock:
+            self.requests.pop(request_uuid, None)
+
+    def __evict_expired(self, now: float) -> None:
+        # the least recently used requests are at the front
+        while self.requests:
+            entries = next(iter(self.requests.values()))
+            if any(now - result.cached_at <= self.ttl_s for result in entries.values()):
+                return
+            self.requests.popitem(last=False)
+
+    def __find(self, entries: OrderedDict, frame_hash: int, now: float) -> CachedResult | None:
+        # the entries of a request are few, a linear scan is cheaper
+        # than any index over the hamming distance
+        for cached_hash in reversed(entries):
+            result = entries[cached_hash]
+            if now - result.cached_at > self.ttl_s:
+                continue
+            if (cached_hash ^ frame_hash).bit_count() <= self.hash_distance:
+                entries.move_to_end(cached_hash)
+                return result
+        return None
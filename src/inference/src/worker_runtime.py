@@ -0,0 +1,134 @@
+import os
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable
+from dotenv import load_dotenv, find_dotenv
+
+from metrics import metrics
+from logger import log
+
+_env_file = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(_env_file)
+
+
+class WorkerRuntime():
+    """
+        bounded thread and process pools behind one bounded queue of tasks
+
+        submit blocks when max_queue tasks are pending, up to its timeout
+        when it is given, then it returns None. is_saturated turns on
+        at the high watermark and off at the low one, the consumer loop uses
+        it to pause and resume its kafka partitions, so a burst stays in
+        kafka instead of the memory of the service
+    """
+
+    def __init__(self,
+                 name: str = "worker",
+                 max_threads: int | None = None,
+                 max_processes: int | None = None,
+                 max_queue: int | None = None,
+                 process_initializer: Callable | None = None,
+                 process_initargs: tuple = ()):
+        self.name = name
+        self.max_threads = max_threads or self._get_max_threads()
+        self.max_processes = max_processes or self._get_max_processes()
+        self.max_queue = max_queue or self._get_max_queue()
+        self.high_watermark = max(int(self.max_queue * 0.8), 1)
+        self.low_watermark = int(self.max_queue * 0.5)
+        self.process_initializer = process_initializer
+        self.process_initargs = process_initargs
+
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._is_saturated = False
+        self.thread_pool = ThreadPoolExecutor(
+            max_workers=self.max_threads, thread_name_prefix=name)
+        self.process_pool = None
+
+    def _get_max_threads(self):
+        max_threads = int(os.environ.get('WORKER_MAX_THREADS', 8))
+        return max_threads
+
+    def _get_max_processes(self):
+        max_processes = int(os.environ.get('WORKER_MAX_PROCESSES', os.cpu_count() or 1))
+        return max_processes
+
+    def _get_max_queue(self):
+        max_queue = int(os.environ.get('WORKER_MAX_QUEUE', 256))
+        return max_queue
+
+    def __get_process_pool(self) -> ProcessPoolExecutor:
+        # processes are spawned, not forked, so they do not inherit
+        # the kafka clients and the threads of the service
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.max_processes,
+                mp_context=mp.get_context("spawn"),
+                initializer=self.process_initializer,
+                initargs=self.process_initargs,
+            )
+        return self.process_pool
+
+    def start_processes(self) -> None:
+        """
+            spawns the whole process pool now and waits for the initializer
+            of every worker, the pool is otherwise spawned by the first tasks
+        """
+        pool = self.__get_process_pool()
+        # every worker must take one of the tasks, so they wait for each other
+        with mp.get_context("spawn").Manager() as manager:
+            barrier = manager.Barrier(self.max_processes)
+            futures = [pool.submit(barrier.wait) for _ in range(self.max_processes)]
+            for future in futures:
+                future.result()
+        log.info(f"{self.name} process pool of {self.max_processes} workers is started")
+
+    def pending(self) -> int:
+        return self._pending
+
+    def is_saturated(self) -> bool:
+        with self._lock:
+            if self._pending >= self.high_watermark:
+                self._is_saturated = True
+            elif self._pending <= self.low_watermark:
+                self._is_saturated = False
+            return self._is_saturated
+
+    def submit(self, fn: Callable, *args, timeout: float | None = None) -> Future | None:
+        return self.__submit(self.thread_pool, fn, *args, timeout=timeout)
+
+    def submit_process(self, fn: Callable, *args, timeout: float | None = None) -> Future | None:
+        return self.__submit(self.__get_process_pool(), fn, *args, timeout=timeout)
+
+    def __submit(self, pool, fn: Callable, *args, timeout: float | None = None) -> Future | None:
+        if not self._slots.acquire(timeout=timeout):
+            return None
+        with self._lock:
+            self._pending += 1
+        metrics.set_gauge(f"{self.name}_runtime_pending", self._pending)
+
+        try:
+            future = pool.submit(fn, *args)
+        except Exception:
+            self.__release()
+            raise
+        future.add_done_callback(self.__on_done)
+        return future
+
+    def __on_done(self, future: Future):
+        self.__release()
+        ex = None if future.cancelled() else future.exception()
+        if ex is not None:
+            log.critical(f"{self.name} task is failed because of ex: {ex}")
+
+    def __release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def shutdown(self, wait: bool = True):
+        self.thread_pool.shutdown(wait=wait)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=wait)
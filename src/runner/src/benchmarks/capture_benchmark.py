@@ -0,0 +1,91 @@
+"""
+    compare capture backends of the runner on a local video file
+
+    usage (from the runner src dir):
+        python3 -m benchmarks.capture_benchmark ./video.mp4 --target-fps 1
+
+    every backend reads the whole file once, the result is frames/s of the
+    stream time processed and cpu usage of the single stream reader
+"""
+import argparse
+import time
+
+import cv2
+
+from capture.capture_service import FrameSampler, OpenCVCapture, PyAVCapture
+
+BACKENDS = ("opencv-read", "opencv", "pyav-all", "pyav")
+
+
+def open_backend(name: str, source: str, decoder_threads: int):
+    match name:
+        case "opencv-read" | "opencv":
+            return OpenCVCapture(source)
+        case "pyav-all":
+            return PyAVCapture(source, decoder_threads=decoder_threads, keyframes_only=False)
+        case "pyav":
+            return PyAVCapture(source, decoder_threads=decoder_threads)
+        case _:
+            raise ValueError(f"unknown backend: {name}")
+
+
+def run_backend(name: str, source: str, target_fps: float, decoder_threads: int) -> dict:
+    vid = open_backend(name, source, decoder_threads)
+    sampler = FrameSampler(target_fps=target_fps, stream_fps=vid.get_fps())
+
+    grabbed = 0
+    sampled = 0
+    started_at = time.perf_counter()
+    cpu_started_at = time.process_time()
+
+    while vid.grab():
+        grabbed += 1
+        if name == "opencv-read":
+            # previous behaviour: every frame is decoded and converted
+            vid.retrieve()
+        if sampler.should_sample(vid.get_position_ms()):
+            ret, _ = vid.retrieve()
+            sampled += int(ret)
+
+    wall = time.perf_counter() - started_at
+    cpu = time.process_time() - cpu_started_at
+    vid.release()
+
+    return {
+        "backend": name,
+        "grabbed": grabbed,
+        "sampled": sampled,
+        "wall_s": wall,
+        "frames_per_s": grabbed / wall if wall else 0.0,
+        "cpu_s": cpu,
+        "cpu_per_stream": cpu / wall if wall else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", help="path to the local video file")
+    parser.add_argument("--target-fps", type=float, default=1.0)
+    parser.add_argument("--decoder-threads", type=int, default=0)
+    parser.add_argument("--backends", nargs="+",
+                        default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+
+    print(f"{'backend':<12} {'grabbed':>8} {'sampled':>8} {'wall, s':>8} "
+          f"{'frames/s':>10} {'cpu, s':>8} {'cpu/stream':>10}")
+    for name in args.backends:
+        try:
+            res = run_backend(name, args.source,
+                              args.target_fps, args.decoder_threads)
+        except ImportError as ex:
+            print(f"{name:<12} skipped: {ex}")
+            continue
+        print(f"{res['backend']:<12} {res['grabbed']:>8} {res['sampled']:>8} "
+              f"{res['wall_s']:>8.2f} {res['frames_per_s']:>10.1f} "
+              f"{res['cpu_s']:>8.2f} {res['cpu_per_stream']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,82 @@
+import atexit
 import json
+import os
+import threading
+import signal
 
 from broker.broker_producer_conf import producer_config
-from broker.broker_consumer_conf import consumer_config
+from broker.broker_consumer_conf import consumer_config, consume_batch_config
 from runner_models import Event
 from logger import log
 
 from confluent_kafka import Producer, Consumer, KafkaError, KafkaException
 
+PRODUCER_FLUSH_TIMEOUT = 10
+
+_producer = None
+_producer_pid = None
+_producer_lock = threading.Lock()
+_terminate_callbacks = []
+
+
+def get_producer() -> Producer:
+    """
+        one producer per process, shared by all the Broker objects, so the
+        connection and the batches are kept between the published events
+    """
+    global _producer, _producer_pid
+    with _producer_lock:
+        if _producer is None or _producer_pid != os.getpid():
+            _producer = Producer(**producer_config)
+            _producer_pid = os.getpid()
+            atexit.register(flush_producer)
+    return _producer
+
+
+def flush_producer(timeout: float = PRODUCER_FLUSH_TIMEOUT) -> int:
+    if _producer is None or _producer_pid != os.getpid():
+        return 0
+    not_delivered = _producer.flush(timeout)
+    if not_delivered:
+        log.error(f"{not_delivered} events are not delivered before flush timeout")
+    return not_delivered
+
+
+def _on_delivery(err, msg) -> None:
+    if err is not None:
+        log.error(
+            f"""failed to deliver event to topic: {msg.topic()}
+            with key: {msg.key()}
+            because of error: {err}""")
+
+
+def on_terminate(callback) -> None:
+    """
+        registers a cleanup to run on SIGTERM, os._exit skips atexit.
+        the forked children inherit the list, so a callback runs only
+        in the process which has registered it
+    """
+    _terminate_callbacks.append((os.getpid(), callback))
+
+
+def flush_producer_on_terminate() -> None:
+    """
+        stream readers are stopped with SIGTERM, the events which are
+        still queued in the producer are delivered before the exit
+    """
+    def _on_terminate(signum, frame):
+        for pid, callback in _terminate_callbacks:
+            if pid != os.getpid():
+                continue
+            try:
+                callback()
+            except Exception as ex:
+                log.error(f"terminate cleanup is failed because of ex: {ex}")
+        flush_producer()
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, _on_terminate)
+
 
 class Broker:
     def __init__(self, topics=["fake_test_topic"], producer_only=False):
@@ -15,6 +85,7 @@ class Broker:
         if not producer_only:
             self.consumer = self._get_consumer()
             self.topics = topics
+            self.is_paused = False
 
             self.consumer.subscribe(self.topics)
         else:
@@ -25,7 +96,24 @@ class Broker:
             self.consumer.close()
 
     def _get_producer(self):
-        return Producer(**producer_config)
+        return get_producer()
+
+    def flush(self, timeout: float = PRODUCER_FLUSH_TIMEOUT) -> int:
+        """
+            barrier which waits for the delivery of all the queued events
+        """
+        return flush_producer(timeout)
+
+    def __produce(self, topic: str, key: str, value: str) -> None:
+        try:
+            self.producer.produce(
+                topic, key=key, value=value, on_delivery=_on_delivery)
+        except BufferError:
+            # local queue is full, serve delivery reports to free it
+            self.producer.poll(1.0)
+            self.producer.produce(
+                topic, key=key, value=value, on_delivery=_on_delivery)
+        self.producer.poll(0)
 
     def _get_consumer(self):
         return Consumer(**consumer_config)
@@ -42,12 +130,57 @@ class Broker:
         event = self.__assemble_event_from_message(message)
         return event
 
+    def consume_events(self,
+                       max_messages: int = consume_batch_config["max_messages"],
+                       timeout: float = consume_batch_config["timeout"]) -> list[Event]:
+        """
+            returns up to max_messages events which are available within
+            timeout, an empty list if there are none
+        """
+        msgs = self.consumer.consume(num_messages=max_messages, timeout=timeout)
+
+        events = []
+        for msg in msgs:
+            if msg.error():
+                self.__process_broker_batch_error(msg)
+                continue
+            try:
+                message = self.__broker_msg_to_py_obj(msg)
+                events.append(self.__assemble_event_from_message(message))
+            except (ValueError, KeyError) as ex:
+                log.error(
+                    f"invalid message at {msg.topic()} [{msg.partition()}] offset {msg.offset()}: {ex}")
+        return events
+
+    def pause(self) -> None:
+        """
+            stops fetching from the assigned partitions, the consumer keeps
+            polling, so it stays in the group while the service catches up
+        """
+        assignment = self.consumer.assignment()
+        if assignment:
+            self.consumer.pause(assignment)
+            if not self.is_paused:
+                log.warning(f"consumption of {self.topics} is paused")
+            self.is_paused = True
+
+    def resume(self) -> None:
+        if not self.is_paused:
+            return
+        assignment = self.consumer.assignment()
+        if assignment:
+            self.consumer.resume(assignment)
+        self.is_paused = False
+        log.warning(f"consumption of {self.topics} is resumed")
+
     def __assemble_event_from_message(self, message: dict[str:str]):
         event = Event(
             event=message["event"],
             state=message["state"],
             request_uuid=message["request_uuid"],
-            stream_source=message["stream_source"]
+            stream_source=message["stream_source"],
+            params=message.get("params", {}),
+            captured_at=message.get("captured_at", 0.0),
         )
         return event
 
@@ -63,6 +196,15 @@ class Broker:
             elif msg.error():
                 raise KafkaException(msg.error())
 
+    def __process_broker_batch_error(self, msg) -> None:
+        # one broken message must not drop the rest of the batch
+        if msg.error().fatal():
+            raise KafkaException(msg.error())
+        try:
+            self.__process_broker_error(msg)
+        except KafkaException as ex:
+            log.error(f"failed to consume message because of ex: {ex}")
+
     def publish_event(self, event: Event, topic: str, state: str) -> None:
 
         log.debug(f"""try to publish event: {event.event} 
@@ -76,7 +218,7 @@ class Broker:
         try:
             _topic = topic
             current_state = state
-            self.producer.produce(
+            self.__produce(
                 _topic,
                 key=event.request_uuid,
                 value=json.dumps(
@@ -85,13 +227,14 @@ class Broker:
                         "event": event.event,
                         "request_uuid": event.request_uuid,
                         "stream_source": event.stream_source,
+                        "params": event.params,
+                        "captured_at": event.captured_at,
                     }
                 )
             )
 
-            self.producer.flush()
             log.info(
-                f"""event: {event.event}, with event_uuid: {event.request_uuid} is published""")
+                f"""event: {event.event}, with event_uuid: {event.request_uuid} is queued for publishing""")
 
         except Exception as ex:
             log.error(
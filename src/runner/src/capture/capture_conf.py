@@ -0,0 +1,40 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+
+class CaptureConfig(object):
+    def __init__(self):
+        self.target_fps = self._get_target_fps()
+        self.backend = self._get_backend()
+        self.decoder_threads = self._get_decoder_threads()
+
+    def _get_target_fps(self):
+        target_fps = float(os.environ.get('RUNNER_TARGET_FPS', 0.3))
+        if target_fps <= 0:
+            raise ValueError(
+                f"Invalid target fps for frames sampling: {target_fps}, must be > 0")
+        return target_fps
+
+    def _get_backend(self):
+        backend = os.environ.get('RUNNER_CAPTURE_BACKEND', "opencv")
+        return backend
+
+    def _get_decoder_threads(self):
+        # 0 lets ffmpeg pick the threads count by itself
+        threads = int(os.environ.get('RUNNER_DECODER_THREADS', 0))
+        return threads
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "target_fps": self.target_fps,
+            "backend": self.backend,
+            "decoder_threads": self.decoder_threads,
+        }
+        return config
+
+
+_config_manager = CaptureConfig()
+capture_config = _config_manager.get_config()
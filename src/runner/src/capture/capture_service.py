@@ -0,0 +1,223 @@
+import time
+
+import cv2
+import numpy.typing as npt
+
+from capture.capture_conf import capture_config
+from runner_models import Event, CaptureSettings
+
+CAPTURE_BACKENDS = ("opencv", "pyav")
+INVALID_FRAMES_BEFORE_INTERRUPTION = 50
+GRAB_INTERVAL_SMOOTHING = 0.2
+
+
+def get_capture_settings(event: Event) -> CaptureSettings:
+    params = event.params or {}
+    settings = CaptureSettings(
+        backend=params.get("capture_backend", capture_config["backend"]),
+        target_fps=float(
+            params.get("target_fps", capture_config["target_fps"])),
+        decoder_threads=int(
+            params.get("decoder_threads", capture_config["decoder_threads"])),
+    )
+    if settings.backend not in CAPTURE_BACKENDS:
+        raise ValueError(
+            f"Invalid capture backend: {settings.backend}, expected one of: {CAPTURE_BACKENDS}")
+    if settings.target_fps <= 0:
+        raise ValueError(
+            f"Invalid target fps for frames sampling: {settings.target_fps}, must be > 0")
+    return settings
+
+
+def open_capture(source: str, settings: CaptureSettings):
+    match settings.backend:
+        case "pyav":
+            return PyAVCapture(source, decoder_threads=settings.decoder_threads)
+        case _:
+            return OpenCVCapture(source)
+
+
+class OpenCVCapture():
+    def __init__(self, source: str):
+        self.vid = cv2.VideoCapture(source)
+
+    def get_fps(self) -> float:
+        return self.vid.get(cv2.CAP_PROP_FPS)
+
+    def grab(self) -> bool:
+        return self.vid.grab()
+
+    def get_position_ms(self) -> float:
+        return self.vid.get(cv2.CAP_PROP_POS_MSEC)
+
+    def retrieve(self) -> tuple[bool, npt.ArrayLike]:
+        return self.vid.retrieve()
+
+    def release(self):
+        self.vid.release()
+
+
+class PyAVCapture():
+    """
+        ffmpeg reader which decodes key frames only
+
+        the decoder drops every non key frame before decoding, so for h264
+        streams with a usual gop the decode cost falls by the gop length.
+        sampling is then made among the key frames
+    """
+
+    def __init__(self, source: str, decoder_threads: int = 0, keyframes_only: bool = True):
+        # optional dependency, the runner falls back to opencv without it
+        import av
+
+        self._av = av
+        options = {"rtsp_transport": "tcp"} if source.startswith("rtsp") else {}
+        self.container = av.open(source, options=options)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self.stream.codec_context.thread_count = decoder_threads
+        if keyframes_only:
+            self.stream.codec_context.skip_frame = "NONKEY"
+        self.keyframes_only = keyframes_only
+        self.frames = self.container.decode(self.stream)
+        self.frame = None
+
+    def get_fps(self) -> float:
+        # fps is meaningless for the frame counter when non key frames are
+        # skipped, the sampler then relies on the frame timestamps
+        if self.keyframes_only or not self.stream.average_rate:
+            return 0.0
+        return float(self.stream.average_rate)
+
+    def grab(self) -> bool:
+        try:
+            self.frame = next(self.frames)
+            return True
+        except (StopIteration, self._av.error.FFmpegError):
+            self.frame = None
+            return False
+
+    def get_position_ms(self) -> float:
+        if self.frame is None or self.frame.time is None:
+            return 0.0
+        return self.frame.time * 1000.0
+
+    def retrieve(self) -> tuple[bool, npt.ArrayLike]:
+        if self.frame is None:
+            return False, None
+        return True, self.frame.to_ndarray(format="bgr24")
+
+    def release(self):
+        self.container.close()
+
+
+class FrameSampler():
+    """
+        time based sampling policy for a single stream
+
+        a frame is sampled when at least 1 / target_fps seconds of stream
+        time passed since the previous sampled one. stream time is taken
+        from the container timestamps if they are available, then from
+        the frame counter and the stream fps, and as a last resort from
+        the wall clock (live sources without timestamps)
+    """
+
+    def __init__(self, target_fps: float, stream_fps: float = 0.0):
+        self.interval_ms = 1000.0 / target_fps
+        self.stream_fps = stream_fps if stream_fps and stream_fps > 0 else 0.0
+        self.started_at = time.monotonic()
+        self.frames = 0
+        self.last_ts_ms = None
+        self.next_sample_ms = None
+
+    def should_sample(self, position_ms: float = 0.0) -> bool:
+        self.frames += 1
+        ts_ms = self._get_timestamp_ms(position_ms)
+
+        if self.last_ts_ms is not None and ts_ms < self.last_ts_ms:
+            # clock is reset, e.g. reconnect of the live source
+            self.next_sample_ms = None
+        self.last_ts_ms = ts_ms
+
+        if self.next_sample_ms is not None and ts_ms < self.next_sample_ms:
+            return False
+
+        if self.next_sample_ms is not None:
+            self.next_sample_ms += self.interval_ms
+        if self.next_sample_ms is None or self.next_sample_ms <= ts_ms:
+            self.next_sample_ms = ts_ms + self.interval_ms
+        return True
+
+    def _get_timestamp_ms(self, position_ms: float) -> float:
+        if position_ms and position_ms > 0:
+            return position_ms
+        if self.stream_fps:
+            return self.frames * 1000.0 / self.stream_fps
+        return (time.monotonic() - self.started_at) * 1000.0
+
+
+class StreamReader():
+    """
+        sampled frames source of a single stream
+
+        read_sample never blocks longer than one grab, so the same reader
+        serves both a dedicated process and a worker which multiplexes
+        many streams
+    """
+
+    def __init__(self, event: Event, settings: CaptureSettings, capture):
+        self.event = event
+        self.settings = settings
+        self.capture = capture
+        stream_fps = capture.get_fps()
+        self.sampler = FrameSampler(
+            target_fps=settings.target_fps,
+            stream_fps=stream_fps,
+        )
+        self.grab_interval_s = 1.0 / stream_fps if stream_fps and stream_fps > 0 else 0.0
+        self.corrupted_frames = 0
+        self.last_position_ms = None
+        # wall clock of the last successful grab, the capture time of
+        # the sampled frame, taken before any queue of the owner
+        self.grabbed_at = 0.0
+        # per stream processing of the sampled frames, set by the owner
+        self.preprocessing = None
+        self.gate = None
+
+    def read_sample(self) -> tuple[bool, npt.ArrayLike]:
+        """
+            returns is the stream alive and the sampled frame if any
+        """
+        if not self.capture.grab():
+            self.corrupted_frames += 1
+            is_alive = self.corrupted_frames < INVALID_FRAMES_BEFORE_INTERRUPTION
+            return is_alive, None
+
+        self.corrupted_frames = 0
+        self.grabbed_at = time.time()
+        position_ms = self.capture.get_position_ms()
+        self.__update_grab_interval(position_ms)
+
+        if not self.sampler.should_sample(position_ms):
+            return True, None
+
+        ret, frame = self.capture.retrieve()
+        if not ret or frame is None:
+            return True, None
+        return True, frame
+
+    def __update_grab_interval(self, position_ms: float):
+        # stream time between grabs, e.g. gop duration for key frames only
+        # decoding, is used by the scheduler to pace the live sources
+        if self.last_position_ms is not None and position_ms > self.last_position_ms:
+            delta_s = (position_ms - self.last_position_ms) / 1000.0
+            alpha = GRAB_INTERVAL_SMOOTHING
+            if self.grab_interval_s:
+                self.grab_interval_s = (
+                    1 - alpha) * self.grab_interval_s + alpha * delta_s
+            else:
+                self.grab_interval_s = delta_s
+        self.last_position_ms = position_ms
+
+    def release(self):
+        self.capture.release()
@@ -2,10 +2,8 @@ import os
 import uuid
 import pathlib
 import urllib3
-import pickle
 from io import BytesIO
 
-import numpy as np
 import numpy.typing as npt
 from dotenv import load_dotenv, find_dotenv
 import redis
@@ -13,6 +11,9 @@ from minio import Minio
 from minio.error import S3Error
 
 from runner_models import Event
+from db.frame_container import (
+    CODECS, FRAME_CONTENT_TYPE, FrameTransform, encode_frame, decode_frame
+)
 from logger import log
 
 _env_file = find_dotenv(f'./.{os.getenv("ENV", "dev")}.env')
@@ -101,6 +102,8 @@ class ImgS3Database():
             secure=False
         )
         self.IMAGE_BUCKET_path = pathlib.Path(IMAGE_BUCKET_NAME)
+        self.frame_codec = self._get_frame_codec()
+        self.frame_quality = self._get_frame_quality()
         self.__init_bucket()
 
     def __init_bucket(self):
@@ -127,14 +130,33 @@ class ImgS3Database():
         password = os.environ['MINIO_ROOT_PASSWORD']
         return password
 
-    def save_frame(self, frame: npt.ArrayLike, event: Event) -> str:
-        b_frame = pickle.dumps(frame)
+    def _get_frame_codec(self):
+        codec = os.environ.get('FRAME_CODEC', "jpeg")
+        if codec not in CODECS:
+            raise ValueError(
+                f"Invalid frame codec: {codec}, expected one of: {tuple(CODECS)}")
+        return codec
+
+    def _get_frame_quality(self):
+        quality = int(os.environ.get('FRAME_QUALITY', 85))
+        return quality
+
+    def save_frame(self, frame: npt.ArrayLike, event: Event,
+                   captured_at: float | None = None,
+                   transform: FrameTransform | None = None) -> str:
+        b_frame = encode_frame(
+            frame,
+            codec=self.frame_codec,
+            quality=self.frame_quality,
+            captured_at=captured_at,
+            transform=transform,
+        )
         frm_buff = BytesIO(b_frame)
         bucket_name = IMAGE_BUCKET_NAME
-        content_type = "image/png"
+        content_type = FRAME_CONTENT_TYPE
         frm_obj_name = str(
             self.IMAGE_BUCKET_path / event.request_uuid / str(uuid.uuid4()))
-        img_meta = {"shape": frame.shape}
+        img_meta = {"codec": self.frame_codec}
 
         result = self.client.put_object(
             bucket_name=bucket_name,
@@ -160,7 +182,7 @@ class ImgS3Database():
             object_name=frm_obj_name
         )
 
-        frame: npt.ArrayLike = np.frombuffer(response.read())
+        frame, _ = decode_frame(response.read())
         if frame is not None:
             log.info(
                 f"frame with frame_id: {frame_id} is retrived from storage")
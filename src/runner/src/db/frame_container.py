@@ -0,0 +1,143 @@
+"""
+    versioned container of a single frame
+
+    header: magic, version, codec, dtype, ndim, shape (up to 3 dims) and
+    capture timestamp, since version 2 followed by the transform which was
+    applied to the source frame (roi crop, scale and letterbox padding),
+    then the payload which is either the raw pixels or the jpeg / webp
+    encoded image. raw payload is decoded without a copy
+"""
+import struct
+import time
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+FRAME_MAGIC = b"FRFC"
+FRAME_CONTAINER_VERSION = 2
+# magic, version, codec, dtype, ndim, shape, captured_at
+FRAME_HEADER = struct.Struct("<4sBB8sB3Id")
+# scale, pad_x, pad_y, roi_x, roi_y
+FRAME_TRANSFORM = struct.Struct("<fffII")
+FRAME_CONTENT_TYPE = "application/x-farseer-frame"
+
+CODECS = {"raw": 0, "jpeg": 1, "webp": 2}
+CODEC_NAMES = {idx: name for name, idx in CODECS.items()}
+
+
+@dataclass
+class FrameTransform:
+    scale: float = 1.0
+    pad_x: float = 0.0
+    pad_y: float = 0.0
+    roi_x: int = 0
+    roi_y: int = 0
+
+    def to_source_boxes(self, xyxy: npt.ArrayLike) -> npt.ArrayLike:
+        """
+            maps boxes (n, 4) of the stored frame to the source frame coords
+        """
+        boxes = np.asarray(xyxy, dtype=np.float32).copy()
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - self.pad_x) / self.scale + self.roi_x
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - self.pad_y) / self.scale + self.roi_y
+        return boxes
+
+
+@dataclass
+class FrameMeta:
+    version: int
+    codec: str
+    dtype: str
+    shape: tuple[int]
+    captured_at: float
+    transform: FrameTransform
+
+
+def encode_frame(frame: npt.ArrayLike,
+                 codec: str = "raw",
+                 quality: int = 85,
+                 captured_at: float | None = None,
+                 transform: FrameTransform | None = None) -> bytes:
+    if codec not in CODECS:
+        raise ValueError(f"Invalid frame codec: {codec}, expected one of: {tuple(CODECS)}")
+    if frame.ndim > 3:
+        raise ValueError(f"Invalid frame shape: {frame.shape}, expected up to 3 dims")
+
+    frame = np.ascontiguousarray(frame)
+    shape = tuple(frame.shape) + (0,) * (3 - frame.ndim)
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC,
+        FRAME_CONTAINER_VERSION,
+        CODECS[codec],
+        frame.dtype.str.encode(),
+        frame.ndim,
+        *shape,
+        captured_at if captured_at is not None else time.time(),
+    )
+    transform = transform or FrameTransform()
+    header += FRAME_TRANSFORM.pack(
+        transform.scale,
+        transform.pad_x,
+        transform.pad_y,
+        transform.roi_x,
+        transform.roi_y,
+    )
+
+    match codec:
+        case "jpeg":
+            is_encoded, payload = cv2.imencode(
+                ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        case "webp":
+            is_encoded, payload = cv2.imencode(
+                ".webp", frame, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        case _:
+            is_encoded, payload = True, frame.reshape(-1).view(np.uint8)
+
+    if not is_encoded:
+        raise ValueError(f"failed to encode frame with codec: {codec}")
+
+    return header + payload.tobytes()
+
+
+def decode_frame_meta(buff) -> FrameMeta:
+    magic, version, codec, dtype, ndim, *rest = FRAME_HEADER.unpack_from(buff, 0)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Invalid frame container, magic is not found")
+    if version > FRAME_CONTAINER_VERSION:
+        raise ValueError(f"Unsupported frame container version: {version}")
+
+    *shape, captured_at = rest
+    if version >= 2:
+        transform = FrameTransform(
+            *FRAME_TRANSFORM.unpack_from(buff, FRAME_HEADER.size))
+    else:
+        transform = FrameTransform()
+
+    return FrameMeta(
+        version=version,
+        codec=CODEC_NAMES[codec],
+        dtype=dtype.rstrip(b"\0").decode(),
+        shape=tuple(shape[:ndim]),
+        captured_at=captured_at,
+        transform=transform,
+    )
+
+
+def get_header_size(version: int) -> int:
+    if version >= 2:
+        return FRAME_HEADER.size + FRAME_TRANSFORM.size
+    return FRAME_HEADER.size
+
+
+def decode_frame(buff) -> tuple[npt.ArrayLike, FrameMeta]:
+    meta = decode_frame_meta(buff)
+    payload = memoryview(buff)[get_header_size(meta.version):]
+
+    if meta.codec == "raw":
+        frame = np.frombuffer(payload, dtype=np.dtype(meta.dtype)).reshape(meta.shape)
+    else:
+        frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+    return frame, meta
@@ -0,0 +1,176 @@
+import os
+import re
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory, util
+
+import numpy.typing as npt
+from dotenv import load_dotenv, find_dotenv
+
+from runner_models import Event
+from db.frame_container import FrameTransform, encode_frame
+from broker.broker_service import on_terminate
+from logger import log
+
+_env_file = find_dotenv(f'./.{os.getenv("ENV", "dev")}.env')
+load_dotenv(_env_file)
+
+SHM_FRAME_PREFIX = "shm://"
+SHM_DIR = "/dev/shm"
+RING_NAME_PREFIX = "farseer-frames"
+RING_MAGIC = b"FRNG"
+# magic, slots count, slot payload size
+RING_HEADER = struct.Struct("<4sIQ")
+RING_HEADER_SIZE = 64
+# sequence number, frame container size
+SLOT_HEADER = struct.Struct("<QQ")
+SLOT_HEADER_SIZE = 64
+
+
+def is_shm_transport_enabled() -> bool:
+    return os.environ.get('FRAME_TRANSPORT', "s3") == "shm"
+
+
+def is_pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_orphaned_frame_rings() -> list[str]:
+    """
+        unlinks the rings of this host whose writer process is gone,
+        a killed writer can not unlink its ring itself
+    """
+    pattern = re.compile(
+        rf"^{re.escape(RING_NAME_PREFIX)}-{re.escape(socket.gethostname())}-(\d+)$")
+    try:
+        names = os.listdir(SHM_DIR)
+    except FileNotFoundError:
+        return []
+
+    swept = []
+    for name in names:
+        match = pattern.match(name)
+        if not match or is_pid_alive(int(match.group(1))):
+            continue
+        try:
+            os.unlink(os.path.join(SHM_DIR, name))
+            swept.append(name)
+        except FileNotFoundError:
+            pass
+        except OSError as ex:
+            log.error(f"failed to unlink orphaned frame ring: {name} because of ex: {ex}")
+    if swept:
+        log.warning(f"orphaned frame rings are unlinked: {swept}")
+    return swept
+
+
+class SharedFrameRing():
+    """
+        ring buffer of frame slots in shared memory, one ring per writer process
+
+        kafka carries only the slot reference: shm://<ring>/<slot>/<seq>.
+        a slot is overwritten when the ring wraps around, the reader detects
+        it by the sequence number, so the ring should hold more frames than
+        the inference backlog of the host
+
+        the ring is allocated on the first frame and its memory is reserved
+        then, if /dev/shm has no room the frames of the process go to s3
+    """
+
+    def __init__(self):
+        self.slots = self._get_slots()
+        self.slot_size = self._get_slot_size()
+        self.name = f"{RING_NAME_PREFIX}-{socket.gethostname()}-{os.getpid()}"
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.shm = None
+        self.is_unavailable = False
+
+    def _get_slots(self):
+        slots = int(os.environ.get('FRAME_RING_SLOTS', 8))
+        return slots
+
+    def _get_slot_size(self):
+        # 0 sizes the slots by the first saved frame, set it for the pool
+        # workers which read streams of different frame sizes
+        slot_size = int(os.environ.get('FRAME_RING_SLOT_BYTES', 0))
+        return slot_size
+
+    def __allocate(self, frame_size: int) -> bool:
+        """
+            creates the ring and reserves its memory up front, a ring over
+            the free /dev/shm would fail with SIGBUS on a write instead
+        """
+        self.slot_size = self.slot_size or frame_size
+        size = RING_HEADER_SIZE + self.slots * (SLOT_HEADER_SIZE + self.slot_size)
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+            os.posix_fallocate(self.shm._fd, 0, size)
+        except OSError as ex:
+            log.error(
+                f"shared frame ring: {self.name} of size: {size} can not be allocated, fallback to s3 because of ex: {ex}")
+            self.close()
+            self.shm = None
+            self.is_unavailable = True
+            return False
+
+        RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, self.slots, self.slot_size)
+        # the writers are forked processes, they exit through os._exit:
+        # multiprocessing runs its finalizers on a normal end and
+        # the SIGTERM handler runs the terminate callbacks, atexit neither
+        util.Finalize(self, self.close, exitpriority=10)
+        on_terminate(self.close)
+        log.info(
+            f"shared frame ring: {self.name} is created with slots: {self.slots} of size: {self.slot_size}")
+        return True
+
+    def close(self):
+        if self.shm is None:
+            return
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def save_frame(self, frame: npt.ArrayLike, event: Event,
+                   captured_at: float | None = None,
+                   transform: FrameTransform | None = None) -> str | None:
+        """returns None when the frame is to be saved to s3 instead"""
+        if self.is_unavailable:
+            return None
+
+        # raw payload, so the reader gets the frame without decoding or copy
+        b_frame = encode_frame(
+            frame, codec="raw", captured_at=captured_at, transform=transform)
+
+        # pool workers save the frames of their streams from many threads
+        with self.lock:
+            if self.shm is None and not self.__allocate(len(b_frame)):
+                return None
+            if len(b_frame) > self.slot_size:
+                log.debug(
+                    f"frame of event: {event.request_uuid} with shape: {frame.shape} does not fit the ring slot")
+                return None
+
+            self.seq += 1
+            seq = self.seq
+            slot = seq % self.slots
+            offset = RING_HEADER_SIZE + slot * (SLOT_HEADER_SIZE + self.slot_size)
+
+            # the slot is invalidated while its payload is being written
+            SLOT_HEADER.pack_into(self.shm.buf, offset, 0, 0)
+            payload_offset = offset + SLOT_HEADER_SIZE
+            self.shm.buf[payload_offset:payload_offset + len(b_frame)] = b_frame
+            SLOT_HEADER.pack_into(self.shm.buf, offset, seq, len(b_frame))
+
+        frame_id = f"{SHM_FRAME_PREFIX}{self.name}/{slot}/{seq}"
+        log.info(f"frame with frame_id: {frame_id} is saved")
+        return frame_id
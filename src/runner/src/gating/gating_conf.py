@@ -0,0 +1,53 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+
+class GatingConfig(object):
+    """
+        defaults of the frame gate thresholds, a negative or zero value
+        switches the check off. every check is off by default, a stream
+        opts in with its own gate_* params or a deployment with these envs
+    """
+
+    def __init__(self):
+        self.hash_distance = self._get_hash_distance()
+        self.black_level = self._get_black_level()
+        self.blur_var = self._get_blur_var()
+        self.max_skip_s = self._get_max_skip_s()
+
+    def _get_hash_distance(self):
+        # hamming distance of 64 bit dhash to treat frames as duplicates
+        distance = int(os.environ.get('RUNNER_GATE_HASH_DISTANCE', 0))
+        return distance
+
+    def _get_black_level(self):
+        # mean luma of the frame, 0 - 255
+        level = float(os.environ.get('RUNNER_GATE_BLACK_LEVEL', 0))
+        return level
+
+    def _get_blur_var(self):
+        # variance of the laplacian, depends on the scene, off by default
+        var = float(os.environ.get('RUNNER_GATE_BLUR_VAR', 0))
+        return var
+
+    def _get_max_skip_s(self):
+        # duplicates are still published once in a while to keep
+        # the stream state and detections fresh
+        max_skip = float(os.environ.get('RUNNER_GATE_MAX_SKIP_S', 5))
+        return max_skip
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "hash_distance": self.hash_distance,
+            "black_level": self.black_level,
+            "blur_var": self.blur_var,
+            "max_skip_s": self.max_skip_s,
+        }
+        return config
+
+
+_config_manager = GatingConfig()
+gating_config = _config_manager.get_config()
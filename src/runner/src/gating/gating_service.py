@@ -0,0 +1,84 @@
+import time
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from gating.gating_conf import gating_config
+from runner_models import Event, GatingSettings
+
+ANALYSIS_WIDTH = 256
+DHASH_SIZE = 8
+
+
+def get_gating_settings(event: Event) -> GatingSettings:
+    params = event.params or {}
+    settings = GatingSettings(
+        hash_distance=int(
+            params.get("gate_hash_distance", gating_config["hash_distance"])),
+        black_level=float(
+            params.get("gate_black_level", gating_config["black_level"])),
+        blur_var=float(
+            params.get("gate_blur_var", gating_config["blur_var"])),
+        max_skip_s=float(
+            params.get("gate_max_skip_s", gating_config["max_skip_s"])),
+    )
+    return settings
+
+
+def get_dhash(gray: npt.ArrayLike) -> int:
+    small = cv2.resize(gray, (DHASH_SIZE + 1, DHASH_SIZE),
+                       interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class FrameGate():
+    """
+        drops sampled frames of a single stream which are not worth
+        inference: black, blurred and near duplicates of the last
+        published frame
+
+        the checks see only the roi of the request, the rest of the frame
+        is not inferred and must not hide a change inside the roi
+    """
+
+    def __init__(self, settings: GatingSettings):
+        self.settings = settings
+        self.last_hash = None
+        self.last_published_at = 0.0
+
+    def check(self, frame: npt.ArrayLike) -> str | None:
+        """
+            returns the reason to drop the frame or None to publish it
+        """
+        settings = self.settings
+        if settings.hash_distance <= 0 and settings.black_level <= 0 and settings.blur_var <= 0:
+            return None
+
+        height, width = frame.shape[:2]
+        if width > ANALYSIS_WIDTH:
+            size = (ANALYSIS_WIDTH, max(round(height * ANALYSIS_WIDTH / width), 1))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+        if settings.black_level > 0 and gray.mean() < settings.black_level:
+            return "black"
+
+        if settings.blur_var > 0 and cv2.Laplacian(gray, cv2.CV_64F).var() < settings.blur_var:
+            return "blurred"
+
+        frame_hash = get_dhash(gray)
+        now = time.monotonic()
+        is_duplicate = (
+            settings.hash_distance > 0
+            and self.last_hash is not None
+            and (frame_hash ^ self.last_hash).bit_count() <= settings.hash_distance
+            and now - self.last_published_at < settings.max_skip_s
+        )
+        if is_duplicate:
+            return "duplicate"
+
+        self.last_hash = frame_hash
+        self.last_published_at = now
+        return None
@@ -18,7 +18,7 @@ def main():
             )
             break
         try:
-            runner_service.read_and_process_event()
+            runner_service.read_and_process_events()
         except Exception as ex:
             log.warning(
                 f"runner server is stopped because of exception: {ex}"
@@ -0,0 +1,53 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+RUNNER_MODES = ("process", "pool")
+
+
+class PoolConfig(object):
+    def __init__(self):
+        self.mode = self._get_mode()
+        self.workers = self._get_workers()
+        self.max_streams_per_worker = self._get_max_streams_per_worker()
+        self.max_worker_load = self._get_max_worker_load()
+        self.load_report_interval = self._get_load_report_interval()
+
+    def _get_mode(self):
+        mode = os.environ.get('RUNNER_MODE', "process")
+        if mode not in RUNNER_MODES:
+            raise ValueError(
+                f"Invalid runner mode: {mode}, expected one of: {RUNNER_MODES}")
+        return mode
+
+    def _get_workers(self):
+        workers = int(os.environ.get('RUNNER_POOL_WORKERS', os.cpu_count() or 1))
+        return max(workers, 1)
+
+    def _get_max_streams_per_worker(self):
+        max_streams = int(os.environ.get('RUNNER_MAX_STREAMS_PER_WORKER', 32))
+        return max_streams
+
+    def _get_max_worker_load(self):
+        max_load = float(os.environ.get('RUNNER_MAX_WORKER_LOAD', 0.9))
+        return max_load
+
+    def _get_load_report_interval(self):
+        interval = float(os.environ.get('RUNNER_LOAD_REPORT_INTERVAL', 10))
+        return interval
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "mode": self.mode,
+            "workers": self.workers,
+            "max_streams_per_worker": self.max_streams_per_worker,
+            "max_worker_load": self.max_worker_load,
+            "load_report_interval": self.load_report_interval,
+        }
+        return config
+
+
+_config_manager = PoolConfig()
+pool_config = _config_manager.get_config()
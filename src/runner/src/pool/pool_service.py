@@ -0,0 +1,283 @@
+import heapq
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from capture.capture_service import StreamReader
+from broker.broker_service import flush_producer_on_terminate
+from runner_models import Event
+from metrics import metrics
+from worker_runtime import WorkerRuntime
+from logger import log
+
+COMMANDS_POLL_INTERVAL = 0.05
+LOAD_WINDOW = 1.0
+
+
+class StreamWorkerPool():
+    """
+        fixed set of worker processes, every one of them reads many streams
+
+        the parent owns the stream -> worker assignment and does admission:
+        a new stream goes to the least busy worker which is below both
+        the streams limit and the load limit, otherwise it is rejected
+
+        the assignments are changed from the consumer loop and from
+        the runtime threads which stop the streams, so they are locked
+    """
+
+    def __init__(self,
+                 workers: int,
+                 max_streams_per_worker: int,
+                 max_worker_load: float,
+                 load_report_interval: float,
+                 open_reader: Callable[[Event], StreamReader],
+                 process_frame: Callable):
+        self.max_streams_per_worker = max_streams_per_worker
+        self.max_worker_load = max_worker_load
+        self.load_report_interval = load_report_interval
+        self.last_load_report_at = time.monotonic()
+
+        self.loads = mp.Array("d", workers)
+        self.notifications = mp.Queue()
+        self.commands = [mp.Queue() for _ in range(workers)]
+        self.assignments: dict[str:int] = {}
+        self.assignments_lock = threading.Lock()
+        self.processes = []
+
+        for idx in range(workers):
+            worker = StreamWorker(
+                idx=idx,
+                commands=self.commands[idx],
+                notifications=self.notifications,
+                loads=self.loads,
+                open_reader=open_reader,
+                process_frame=process_frame,
+            )
+            worker_pr = mp.Process(target=worker.run, daemon=True)
+            worker_pr.start()
+            self.processes.append(worker_pr)
+            log.info(f"stream worker: {idx} is started with pid: {worker_pr.pid}")
+
+    def get_streams_per_worker(self) -> list[int]:
+        with self.assignments_lock:
+            return self.__count_streams()
+
+    def __count_streams(self) -> list[int]:
+        streams = [0] * len(self.processes)
+        for idx in self.assignments.values():
+            streams[idx] += 1
+        return streams
+
+    def is_running(self, event: Event) -> bool:
+        with self.assignments_lock:
+            return event.request_uuid in self.assignments
+
+    def start_stream(self, event: Event) -> bool:
+        with self.assignments_lock:
+            if event.request_uuid in self.assignments:
+                log.warning(f"stream for event: {event.request_uuid} is already running")
+                return True
+
+            streams = self.__count_streams()
+            candidates = [
+                idx for idx in range(len(self.processes))
+                if streams[idx] < self.max_streams_per_worker
+                and self.loads[idx] < self.max_worker_load
+            ]
+            if not candidates:
+                log.warning(
+                    f"stream for event: {event.request_uuid} is rejected, all workers are at capacity: {streams}")
+                metrics.inc("runner_streams_rejected")
+                return False
+
+            idx = min(candidates, key=lambda i: (self.loads[i], streams[i]))
+            self.assignments[event.request_uuid] = idx
+        self.commands[idx].put(("start", event))
+        log.debug(f"stream for event: {event.request_uuid} is assigned to worker: {idx}")
+        return True
+
+    def stop_stream(self, event: Event) -> bool:
+        """
+            releases the stream, only the first caller gets true, so a stop
+            request and the end of the stream do not clean it up twice
+        """
+        with self.assignments_lock:
+            idx = self.assignments.pop(event.request_uuid, None)
+        if idx is None:
+            return False
+        self.commands[idx].put(("stop", event))
+        return True
+
+    def get_ended_streams(self) -> list[Event]:
+        # the ended streams stay assigned until they are stopped,
+        # stop_stream releases them
+        ended = []
+        while True:
+            try:
+                event = self.notifications.get_nowait()
+            except queue.Empty:
+                break
+            ended.append(event)
+        return ended
+
+    def report_load_if_due(self):
+        now = time.monotonic()
+        if now - self.last_load_report_at < self.load_report_interval:
+            return
+        self.last_load_report_at = now
+
+        streams = self.get_streams_per_worker()
+        for idx in range(len(self.processes)):
+            metrics.set_gauge(f"runner_worker_{idx}_load", self.loads[idx])
+            metrics.set_gauge(f"runner_worker_{idx}_streams", streams[idx])
+        log.info(
+            f"stream workers load: {[round(load, 2) for load in self.loads]}, streams: {streams}")
+
+
+class StreamWorker():
+    """
+        reads many streams in one process
+
+        every stream is due again after its grab interval, the earliest due
+        one is read next, so the live sources are drained at their pace
+        and the local files are read in real time
+
+        a read frame is processed (gate, encode, upload) on the runtime
+        threads, so a slow upload does not stall the other streams of
+        the worker. a stream has at most one frame in flight, the frames
+        read while it is busy are dropped as the live ones would be late
+    """
+
+    def __init__(self, idx: int, commands, notifications, loads,
+                 open_reader: Callable[[Event], StreamReader],
+                 process_frame: Callable):
+        self.idx = idx
+        self.commands = commands
+        self.notifications = notifications
+        self.loads = loads
+        self.open_reader = open_reader
+        self.process_frame = process_frame
+        self.readers: dict[str:StreamReader] = {}
+        self.in_flight: dict[str:Future] = {}
+        self.schedule = []
+        self.seq = itertools.count()
+        self.window_started_at = time.monotonic()
+        self.busy = 0.0
+        self.process_busy = 0.0
+        self.process_busy_lock = threading.Lock()
+        self.runtime = None
+
+    def run(self):
+        metrics.reset()
+        flush_producer_on_terminate()
+        # created in the worker process, the threads are not forked
+        self.runtime = WorkerRuntime(name=f"runner_worker_{self.idx}")
+        while True:
+            try:
+                self.__apply_commands()
+                self.__step()
+                self.__update_load()
+                metrics.report_if_due()
+            except Exception as ex:
+                log.critical(f"stream worker: {self.idx} step is failed because of ex: {ex}")
+
+    def __apply_commands(self):
+        while True:
+            try:
+                command, event = self.commands.get_nowait()
+            except queue.Empty:
+                return
+
+            match command:
+                case "start":
+                    self.__start(event)
+                case "stop":
+                    self.__stop(event)
+
+    def __start(self, event: Event):
+        try:
+            reader = self.open_reader(event)
+        except Exception as ex:
+            log.critical(
+                f"failed to open stream for event: {event.request_uuid} because of ex: {ex}")
+            self.notifications.put(event)
+            return
+
+        self.__stop(event)
+        self.readers[event.request_uuid] = reader
+        heapq.heappush(self.schedule, (time.monotonic(), next(self.seq), reader))
+        log.info(f"worker: {self.idx} starts reading stream for event: {event.request_uuid}")
+
+    def __stop(self, event: Event):
+        reader = self.readers.pop(event.request_uuid, None)
+        self.in_flight.pop(event.request_uuid, None)
+        if reader is not None:
+            reader.release()
+            log.info(f"worker: {self.idx} stops reading stream for event: {event.request_uuid}")
+
+    def __step(self):
+        if not self.schedule:
+            time.sleep(COMMANDS_POLL_INTERVAL)
+            return
+
+        due, _, reader = self.schedule[0]
+        now = time.monotonic()
+        if due > now:
+            time.sleep(min(due - now, COMMANDS_POLL_INTERVAL))
+            return
+
+        heapq.heappop(self.schedule)
+        if self.readers.get(reader.event.request_uuid) is not reader:
+            return
+
+        step_started_at = time.monotonic()
+        is_alive, frame = reader.read_sample()
+
+        if not is_alive:
+            log.warning(
+                f"stream reading for event: {reader.event.request_uuid} is stopped because of invalid stream source")
+            self.__stop(reader.event)
+            self.notifications.put(reader.event)
+        else:
+            if frame is not None:
+                self.__submit_frame(frame, reader, reader.grabbed_at)
+            next_due = max(due + reader.grab_interval_s, step_started_at)
+            heapq.heappush(self.schedule, (next_due, next(self.seq), reader))
+
+        self.busy += time.monotonic() - step_started_at
+
+    def __submit_frame(self, frame, reader: StreamReader, captured_at: float):
+        request_uuid = reader.event.request_uuid
+        in_flight = self.in_flight.get(request_uuid)
+        if in_flight is not None and not in_flight.done():
+            metrics.inc("runner_frames_dropped_busy")
+            return
+        self.in_flight[request_uuid] = self.runtime.submit(
+            self.__process_frame, frame, reader, captured_at)
+
+    def __process_frame(self, frame, reader: StreamReader, captured_at: float):
+        started_at = time.monotonic()
+        try:
+            self.process_frame(frame, reader, captured_at)
+        finally:
+            with self.process_busy_lock:
+                self.process_busy += time.monotonic() - started_at
+
+    def __update_load(self):
+        now = time.monotonic()
+        window = now - self.window_started_at
+        if window < LOAD_WINDOW:
+            return
+        with self.process_busy_lock:
+            process_busy, self.process_busy = self.process_busy, 0.0
+        # the reading loop is one thread, the frames are processed
+        # by all the threads of the runtime, the busier one is the load
+        process_load = process_busy / (window * self.runtime.max_threads)
+        self.loads[self.idx] = min(max(self.busy / window, process_load), 1.0)
+        self.busy = 0.0
+        self.window_started_at = now
@@ -0,0 +1,31 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+__ENV_FILE = find_dotenv(f'.{os.getenv("ENV", "dev")}.env')
+load_dotenv(__ENV_FILE)
+
+
+class PreprocessingConfig(object):
+    def __init__(self):
+        self.model_imgsz = self._get_model_imgsz()
+        self.letterbox = self._get_letterbox()
+
+    def _get_model_imgsz(self):
+        # 0 keeps the source resolution
+        imgsz = int(os.environ.get('RUNNER_MODEL_IMGSZ', 0))
+        return imgsz
+
+    def _get_letterbox(self):
+        letterbox = os.environ.get('RUNNER_LETTERBOX', "1") == "1"
+        return letterbox
+
+    def get_config(self) -> dict[str:str]:
+        config = {
+            "model_imgsz": self.model_imgsz,
+            "letterbox": self.letterbox,
+        }
+        return config
+
+
+_config_manager = PreprocessingConfig()
+preprocessing_config = _config_manager.get_config()
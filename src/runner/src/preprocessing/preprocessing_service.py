@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from preprocessing.preprocessing_conf import preprocessing_config
+from db.frame_container import FrameTransform
+from runner_models import Event, PreprocessingSettings
+
+# the same padding color as the ultralytics letterbox
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+def get_preprocessing_settings(event: Event) -> PreprocessingSettings:
+    params = event.params or {}
+    roi = params.get("roi")
+    if roi:
+        roi = tuple(int(val) for val in str(roi).split(","))
+        if len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0:
+            raise ValueError(f"Invalid roi: {roi}, expected x,y,w,h")
+
+    settings = PreprocessingSettings(
+        model_imgsz=int(
+            params.get("model_imgsz", preprocessing_config["model_imgsz"])),
+        letterbox=bool(
+            params.get("letterbox", preprocessing_config["letterbox"])),
+        roi=roi or None,
+    )
+    return settings
+
+
+def crop_roi(frame: npt.ArrayLike,
+             roi: tuple[int, int, int, int]) -> tuple[npt.ArrayLike, tuple[int, int]]:
+    """returns the roi view of the frame and its clamped origin"""
+    x, y, w, h = roi
+    height, width = frame.shape[:2]
+    x, y = min(max(x, 0), width - 1), min(max(y, 0), height - 1)
+    return frame[y:min(y + h, height), x:min(x + w, width)], (x, y)
+
+
+def preprocess_frame(frame: npt.ArrayLike,
+                     settings: PreprocessingSettings) -> tuple[npt.ArrayLike, FrameTransform]:
+    """
+        crops the roi, then downscales the frame to the model input size
+        and letterboxes it to a square, the returned transform maps boxes
+        of the result back to the source frame
+    """
+    transform = FrameTransform()
+
+    if settings.roi:
+        frame, (transform.roi_x, transform.roi_y) = crop_roi(frame, settings.roi)
+
+    if not settings.model_imgsz:
+        return frame, transform
+
+    imgsz = settings.model_imgsz
+    height, width = frame.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    if scale < 1.0:
+        new_size = (max(round(width * scale), 1), max(round(height * scale), 1))
+        frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+        transform.scale = scale
+
+    if settings.letterbox:
+        height, width = frame.shape[:2]
+        pad_x, pad_y = (imgsz - width) // 2, (imgsz - height) // 2
+        if pad_x > 0 or pad_y > 0:
+            frame = cv2.copyMakeBorder(
+                frame,
+                pad_y, imgsz - height - pad_y,
+                pad_x, imgsz - width - pad_x,
+                cv2.BORDER_CONSTANT,
+                value=LETTERBOX_COLOR,
+            )
+            transform.pad_x, transform.pad_y = pad_x, pad_y
+
+    return np.ascontiguousarray(frame), transform
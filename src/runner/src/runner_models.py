@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -7,3 +7,27 @@ class Event:
     state: str
     request_uuid: str
     stream_source: str
+    params: dict = field(default_factory=dict)
+    captured_at: float = 0.0
+
+
+@dataclass
+class CaptureSettings:
+    backend: str
+    target_fps: float
+    decoder_threads: int
+
+
+@dataclass
+class PreprocessingSettings:
+    model_imgsz: int
+    letterbox: bool
+    roi: tuple[int] | None
+
+
+@dataclass
+class GatingSettings:
+    hash_distance: int
+    black_level: float
+    blur_var: float
+    max_skip_s: float
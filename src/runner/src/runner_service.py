@@ -1,22 +1,30 @@
 import multiprocessing as mp
-import threading
 import os
 import signal
+import threading
 
-import cv2
 import numpy.typing as npt
 
-from broker.broker_service import Broker
-from runner_models import Event
+from broker.broker_service import Broker, flush_producer_on_terminate
+from runner_models import Event, CaptureSettings
 from db.db_service import ProcessCacheDatabase, ImgS3Database
+from db.shm_service import (
+    SharedFrameRing, is_shm_transport_enabled, sweep_orphaned_frame_rings
+)
+from capture.capture_service import (
+    StreamReader, get_capture_settings, open_capture
+)
+from preprocessing.preprocessing_service import (
+    crop_roi, get_preprocessing_settings, preprocess_frame
+)
+from gating.gating_service import FrameGate, get_gating_settings
+from db.frame_container import FrameTransform
+from pool.pool_conf import pool_config
+from pool.pool_service import StreamWorkerPool
+from metrics import metrics
+from worker_runtime import WorkerRuntime
 from logger import log
 
-INVALID_FRAMES_BEFORE_INTERRUPTION = 50
-PREDICT_ON_GAP = 100
-if INVALID_FRAMES_BEFORE_INTERRUPTION > PREDICT_ON_GAP:
-    raise ValueError(
-        f"Ivalid gap for frames consumption, before break of invalid: {INVALID_FRAMES_BEFORE_INTERRUPTION} > gap: {PREDICT_ON_GAP}")
-
 CONSUMER_TOPICS = ["api_runner"]
 
 
@@ -24,16 +32,48 @@ class RunnerService():
 
     def __init__(self, topics=CONSUMER_TOPICS):
         self.msg_broker = Broker(topics=topics)
-
-    def read_and_process_event(self):
-        event: Event = self.msg_broker.consume_event()
-
-        if not event:
-            return
-
-        log.debug(f"get event: {event.request_uuid}")
-
-        self._update_stream_reading_with_event(event)
+        self.runtime = WorkerRuntime(name="runner")
+        self.__img_db = None
+        self.__img_db_pid = None
+        self.__frame_ring = None
+        self.__frame_ring_pid = None
+        if is_shm_transport_enabled():
+            sweep_orphaned_frame_rings()
+        # pool workers process the frames of their streams on threads
+        self.__clients_lock = threading.Lock()
+        self.stream_pool = self.__get_stream_pool()
+
+    def __get_stream_pool(self):
+        if pool_config["mode"] != "pool":
+            return None
+        return StreamWorkerPool(
+            workers=pool_config["workers"],
+            max_streams_per_worker=pool_config["max_streams_per_worker"],
+            max_worker_load=pool_config["max_worker_load"],
+            load_report_interval=pool_config["load_report_interval"],
+            open_reader=self._open_stream_reader,
+            process_frame=self._process_frame,
+        )
+
+    def read_and_process_events(self):
+        if self.stream_pool:
+            self.__process_ended_streams()
+            self.stream_pool.report_load_if_due()
+        metrics.report_if_due()
+        self.__apply_backpressure()
+
+        events: list[Event] = self.msg_broker.consume_events()
+
+        for event in events:
+            log.debug(f"get event: {event.request_uuid}")
+
+            self._update_stream_reading_with_event(event)
+
+    def __apply_backpressure(self):
+        if self.runtime.is_saturated():
+            self.msg_broker.pause()
+        else:
+            self.msg_broker.resume()
 
     def _update_stream_reading_with_event(self, event: Event) -> None:
         log.info(
@@ -46,6 +86,12 @@ class RunnerService():
                 self.msg_broker.publish_event(
                     event=event, topic="runner_fsm_st", state="in_startup_processing")
 
+                if self.stream_pool:
+                    if not self.stream_pool.start_stream(event):
+                        self.__publish_event_for_fsm_stenographer_about_rejected_stream(
+                            event)
+                    return
+
                 event_pr = mp.Process(
                     target=self._read_stream,
                     args=((event,)),
@@ -59,55 +105,106 @@ class RunnerService():
                 self.__save_worker_pid(event_pr.pid, event)
 
             case "stop":
-                event_th = threading.Thread(
-                    target=self._stop_stream_reading,
-                    args=((event,)),
-                    daemon=True
-                )
                 log.debug(
-                    f"start processing for event: {event.request_uuid} with thread with pid: {event_th}")
-                event_th.start()
+                    f"start processing for stop event: {event.request_uuid}")
+                self.runtime.submit(self._stop_stream_reading, event)
 
             case _:
                 log.warning(f"not implemented event_type: {event_type}")
 
     def _read_stream(self, event: Event) -> None:
+        flush_producer_on_terminate()
         try:
-            vid = cv2.VideoCapture(event.stream_source)
+            reader = self._open_stream_reader(event)
             log.debug(
-                f"start reading stream for event: {event.request_uuid} and vid: {vid}")
-
-            corrupted_frames = 0
-            frames = 0
+                f"start reading stream for event: {event.request_uuid} with settings: {reader.settings}")
 
             while True:
-                ret, frame = vid.read()
+                is_alive, frame = reader.read_sample()
+
+                if not is_alive:
+                    log.warning(
+                        "stream reading loop is exited because of invalid stream source")
+                    self._stop_stream_reading(event)
+                    break
 
                 if frame is None:
-                    corrupted_frames += 1
-                    if corrupted_frames == INVALID_FRAMES_BEFORE_INTERRUPTION:
-                        log.warning(
-                            "stream reading loop is exited because of invalid stream source")
-                        self._stop_stream_reading(event)
-                        break
                     continue
 
-                frames += 1
+                self._process_frame(frame, reader, reader.grabbed_at)
+                metrics.report_if_due()
 
-                if frames == PREDICT_ON_GAP:
-                    corrupted_frames = 0
+            reader.release()
 
-                    frame_id = self.__save_frame(frame, event)
+        except Exception as ex:
+            log.critical(f"stop reading stream because of ex: {ex}")
 
-                    self.__publish_event_for_inference(event, frame_id)
+    def _open_stream_reader(self, event: Event) -> StreamReader:
+        settings = get_capture_settings(event)
+        vid = self.__open_capture(event, settings)
+        reader = StreamReader(event, settings, vid)
+        reader.preprocessing = get_preprocessing_settings(event)
+        reader.gate = FrameGate(get_gating_settings(event))
+        return reader
+
+    def _process_frame(self, frame: npt.ArrayLike, reader: StreamReader,
+                       captured_at: float):
+        event = reader.event
+
+        gated_frame = frame
+        if reader.preprocessing.roi:
+            gated_frame, _ = crop_roi(frame, reader.preprocessing.roi)
+        gated_reason = reader.gate.check(gated_frame)
+        if gated_reason:
+            metrics.inc(f"runner_frames_gated_{gated_reason}")
+            log.debug(
+                f"frame of event: {event.request_uuid} is gated as {gated_reason}")
+            return
+
+        frame, transform = preprocess_frame(frame, reader.preprocessing)
+        frame_id = self.__save_frame(frame, event, captured_at, transform)
+        metrics.inc("runner_frames_published")
+
+        self.__publish_event_for_inference(event, frame_id, captured_at)
 
-                    frames = 0
-#                    break
+    def __open_capture(self, event: Event, settings: CaptureSettings):
+        try:
+            return open_capture(event.stream_source, settings)
+        except ImportError as ex:
+            log.warning(
+                f"""capture backend: {settings.backend} is unavailable
+                for event: {event.request_uuid} because of ex: {ex},
+                fallback to opencv""")
+            settings.backend = "opencv"
+            return open_capture(event.stream_source, settings)
+
+    def __process_ended_streams(self):
+        for event in self.stream_pool.get_ended_streams():
+            self.runtime.submit(self._stop_stream_reading, event)
+
+    def __publish_event_for_fsm_stenographer_about_rejected_stream(self, event: Event):
+        topic = "runner_fsm_st"
+        state = "inactive"
 
-            vid.release()
+        try:
+            _producer = self.__get_producer()
+            rejected_event = Event(
+                event="rejected",
+                state="",
+                stream_source=event.stream_source,
+                request_uuid=event.request_uuid,
+            )
 
+            _producer.publish_event(
+                event=rejected_event,
+                topic=topic,
+                state=state,
+            )
         except Exception as ex:
-            log.critical(f"stop reading stream because of ex: {ex}")
+            log.error(
+                f"""failed to publish event: {event.event}
+                with event_uuid: {event.request_uuid}
+                because of exception: {ex}""")
 
     def __publish_event_for_fsm_stenographer_about_invalid_stream_source(self, event: Event):
         topic = "runner_fsm_st"
@@ -143,7 +240,8 @@ class RunnerService():
     def __get_producer(self):
         return Broker(producer_only=True)
 
-    def __publish_event_for_inference(self, event: Event, frame_id="", clean_up=False):
+    def __publish_event_for_inference(self, event: Event, frame_id="",
+                                      captured_at=0.0, clean_up=False):
         topic = "runner_inference"
         state = "active"
         if clean_up:
@@ -166,6 +264,7 @@ class RunnerService():
                 state="",
                 stream_source=frame_id,
                 request_uuid=event.request_uuid,
+                captured_at=captured_at,
             )
 
             _producer.publish_event(
@@ -180,11 +279,34 @@ class RunnerService():
                 with event_uuid: {event.request_uuid}
                 because of exception: {ex}""")
 
-    def __save_frame(self, frame: npt.ArrayLike, event: Event):
-        _img_db = ImgS3Database()
-        frame_id = _img_db.save_frame(frame, event)
+    def __save_frame(self, frame: npt.ArrayLike, event: Event,
+                     captured_at: float, transform: FrameTransform):
+        if is_shm_transport_enabled():
+            frame_id = self.__get_frame_ring().save_frame(
+                frame, event, captured_at, transform)
+            if frame_id:
+                return frame_id
+
+        _img_db = self.__get_img_db()
+        frame_id = _img_db.save_frame(frame, event, captured_at, transform)
         return frame_id
 
+    def __get_frame_ring(self) -> SharedFrameRing:
+        with self.__clients_lock:
+            if self.__frame_ring is None or self.__frame_ring_pid != os.getpid():
+                self.__frame_ring = SharedFrameRing()
+                self.__frame_ring_pid = os.getpid()
+            return self.__frame_ring
+
+    def __get_img_db(self) -> ImgS3Database:
+        # one client per process, stream readers are forked with
+        # the service object and must not share its connections
+        with self.__clients_lock:
+            if self.__img_db is None or self.__img_db_pid != os.getpid():
+                self.__img_db = ImgS3Database()
+                self.__img_db_pid = os.getpid()
+            return self.__img_db
+
     def __save_worker_pid(self, pid: int, event: Event):
         cache_db = ProcessCacheDatabase()
         cache_db.save_pid(pid, event)
@@ -192,13 +314,18 @@ class RunnerService():
     def _stop_stream_reading(self, event: Event):
         log.info(f"start to stop event: {event.request_uuid}")
 
-        cache_db = ProcessCacheDatabase()
-        is_exists = cache_db.is_exists(event)
-
-        if not is_exists:
-            log.critical(
-                f"""can't find pid for event: {event.request_uuid},
-                may be ended before. still will try to clear image db""")
+        if self.stream_pool:
+            # the stream is released once, by a stop request or by its end
+            if not self.stream_pool.stop_stream(event):
+                log.debug(
+                    f"stream for event: {event.request_uuid} is not running, nothing to stop")
+                return
+        else:
+            cache_db = ProcessCacheDatabase()
+            if not cache_db.is_exists(event):
+                log.critical(
+                    f"""can't find pid for event: {event.request_uuid},
+                    may be ended before. still will try to clear image db""")
 
         log.debug(
             f"before main actions of deletion for event: {event.request_uuid}")
@@ -206,8 +333,9 @@ class RunnerService():
         self.__publish_event_for_fsm_stenographer_about_in_shutdown_processing(
             event)
 
-        self.__kill_stream_processes(event)
-        self.__clear_cache_db(event)
+        if not self.stream_pool:
+            self.__kill_stream_processes(event)
+            self.__clear_cache_db(event)
         self.__clear_image_storage(event)
 
         self.__publish_event_for_inference(event, clean_up=True)